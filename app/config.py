@@ -9,10 +9,18 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent.parent
 UPLOAD_DIR = BASE_DIR / "uploads"
 UPLOAD_DIR.mkdir(exist_ok=True)
+DATA_DIR = BASE_DIR / "data"
 
 # ---------- File Upload ----------
 ALLOWED_IMAGE_MIME = {"image/jpeg", "image/png", "image/gif", "image/webp"}
 ALLOWED_AUDIO_MIME = {"audio/webm", "audio/mp3", "audio/mpeg", "audio/mp4", "audio/wav", "audio/ogg", "audio/x-m4a"}
+IMAGE_EXTENSIONS = {"image/jpeg": ".jpg", "image/png": ".png", "image/gif": ".gif", "image/webp": ".webp"}
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+IMAGE_THUMBNAIL_PX = int(os.getenv("IMAGE_THUMBNAIL_PX", "256"))
+IMAGE_PREVIEW_PX = int(os.getenv("IMAGE_PREVIEW_PX", "1280"))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 # ---------- MySQL (Settings DB) ----------
 MYSQL_USER = os.getenv("MYSQL_USER", "fastapi_user")
@@ -23,6 +31,13 @@ MYSQL_DB_SETTINGS = os.getenv("MYSQL_DB_SETTINGS", "settings_db")
 
 _encoded_password = quote_plus(MYSQL_PASSWORD)
 SETTINGS_MYSQL_URL = f"mysql+pymysql://{MYSQL_USER}:{_encoded_password}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB_SETTINGS}"
+SETTINGS_MYSQL_ASYNC_URL = f"mysql+aiomysql://{MYSQL_USER}:{_encoded_password}@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DB_SETTINGS}"
+MYSQL_POOL_SIZE = int(os.getenv("MYSQL_POOL_SIZE", "5"))
+MYSQL_MAX_OVERFLOW = int(os.getenv("MYSQL_MAX_OVERFLOW", "10"))
+MYSQL_POOL_TIMEOUT_SECONDS = int(os.getenv("MYSQL_POOL_TIMEOUT_SECONDS", "30"))
+# Below MySQL's wait_timeout so idle connections are replaced before the server drops them.
+MYSQL_POOL_RECYCLE_SECONDS = int(os.getenv("MYSQL_POOL_RECYCLE_SECONDS", "1800"))
+MYSQL_POOL_PRE_PING = os.getenv("MYSQL_POOL_PRE_PING", "true").lower() == "true"
 
 # ---------- MongoDB ----------
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017/")
@@ -31,13 +46,62 @@ MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "chatbot_db")
 # ---------- Google Gemini API ----------
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
 GEMINI_DEFAULT_MODEL = os.getenv("GEMINI_DEFAULT_MODEL", "gemini-2.5-flash-lite")
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))
+GEMINI_MODEL_CACHE_SIZE = int(os.getenv("GEMINI_MODEL_CACHE_SIZE", "64"))
+GEMINI_MODEL_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_MODEL_CACHE_TTL_SECONDS", "3600"))
 
 # ---------- Serper (Google Search) API ----------
 SERPER_API_KEY = os.getenv("SERPER_API_KEY", "")
 SERPER_API_URL = os.getenv("SERPER_API_URL", "https://google.serper.dev/search")
 
+# ---------- Scraping (outbound HTTP) ----------
+SCRAPE_TIMEOUT_SECONDS = float(os.getenv("SCRAPE_TIMEOUT_SECONDS", "8"))
+SCRAPE_DEADLINE_SECONDS = float(os.getenv("SCRAPE_DEADLINE_SECONDS", "12"))
+MAX_PAGE_CHARS = int(os.getenv("MAX_PAGE_CHARS", "20000"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+HOST_MAX_CONNECTIONS = int(os.getenv("HOST_MAX_CONNECTIONS", "10"))
+HOST_RATE_PER_SECOND = float(os.getenv("HOST_RATE_PER_SECOND", "5"))
+HOST_RATE_BURST = int(os.getenv("HOST_RATE_BURST", "10"))
+HOST_RATE_MAX_WAIT_SECONDS = float(os.getenv("HOST_RATE_MAX_WAIT_SECONDS", "2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+# ---------- HTML parse pool (0 workers = parse in a thread) ----------
+PARSE_POOL_WORKERS = int(os.getenv("PARSE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+PARSE_TIMEOUT_SECONDS = float(os.getenv("PARSE_TIMEOUT_SECONDS", "10"))
+PARSE_POOL_MAX_TASKS = int(os.getenv("PARSE_POOL_MAX_TASKS", "500"))
+PARSE_POOL_MAX_RSS_MB = int(os.getenv("PARSE_POOL_MAX_RSS_MB", "512"))
+
 # ---------- Redis ----------
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/")   
+REDIS_RETRY_SECONDS = float(os.getenv("REDIS_RETRY_SECONDS", "30"))
+
+# ---------- Search result cache ----------
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "21600"))
+SEARCH_CACHE_NEGATIVE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_NEGATIVE_TTL_SECONDS", "300"))
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+
+# ---------- Page content cache ----------
+CONTENT_CACHE_FRESH_SECONDS = int(os.getenv("CONTENT_CACHE_FRESH_SECONDS", "86400"))
+CONTENT_CACHE_MAX_AGE_SECONDS = int(os.getenv("CONTENT_CACHE_MAX_AGE_SECONDS", "604800"))
+CONTENT_CACHE_MAX_ENTRIES = int(os.getenv("CONTENT_CACHE_MAX_ENTRIES", "512"))
+
+# ---------- RAG answer cache ----------
+RAG_ANSWER_CACHE_TTL_SECONDS = int(os.getenv("RAG_ANSWER_CACHE_TTL_SECONDS", "1800"))
+RAG_ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "256"))
+RAG_LOCK_TTL_SECONDS = float(os.getenv("RAG_LOCK_TTL_SECONDS", "90"))
+RAG_LOCK_WAIT_SECONDS = float(os.getenv("RAG_LOCK_WAIT_SECONDS", "60"))
+RAG_LOCK_POLL_SECONDS = 0.25
+
+# ---------- Local search index ----------
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+SEARCH_INDEX_PATH = Path(os.getenv("SEARCH_INDEX_PATH", str(DATA_DIR / "search_index.sqlite3")))
+SEARCH_INDEX_MIN_COVERAGE = float(os.getenv("SEARCH_INDEX_MIN_COVERAGE", "0.75"))
+
+# ---------- RAG context packing ----------
+PASSAGE_CHARS = int(os.getenv("PASSAGE_CHARS", "600"))
+RAG_CONTEXT_CHAR_BUDGET = int(os.getenv("RAG_CONTEXT_CHAR_BUDGET", "12000"))
 
 
 # ---------- Gemini Chat ----------
@@ -50,7 +114,32 @@ LANGUAGE_INSTRUCTIONS = {
     "de": "Antworte nur auf Deutsch.",
 }
 
+# ---------- Chat context ----------
+CHAT_CONTEXT_RING_SIZE = int(os.getenv("CHAT_CONTEXT_RING_SIZE", "40"))
+CHAT_CONTEXT_RING_TTL_SECONDS = int(os.getenv("CHAT_CONTEXT_RING_TTL_SECONDS", "86400"))
+CHAT_CONTEXT_TOKEN_BUDGET = int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "4000"))
+CHAT_SUMMARY_MAX_WORDS = int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "200"))
+CHAT_COMPACTION_MIN_MESSAGES = int(os.getenv("CHAT_COMPACTION_MIN_MESSAGES", "4"))
+
+# ---------- Pagination ----------
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "30"))
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "50"))
+MAX_PAGE_SIZE = 100
+
 # ---------- Summary ----------
 MAX_SUMMARY_MESSAGES = 50
 MAX_CONVERSATION_CHARS = 15000
 GEMINI_TIMEOUT_SECONDS = 60
+SUMMARY_PRECOMPUTE_ENABLED = os.getenv("SUMMARY_PRECOMPUTE_ENABLED", "true").lower() == "true"
+SUMMARY_IDLE_MINUTES = int(os.getenv("SUMMARY_IDLE_MINUTES", "10"))
+SUMMARY_PRECOMPUTE_INTERVAL_SECONDS = int(os.getenv("SUMMARY_PRECOMPUTE_INTERVAL_SECONDS", "60"))
+SUMMARY_PRECOMPUTE_BATCH = int(os.getenv("SUMMARY_PRECOMPUTE_BATCH", "20"))
+SUMMARY_PRECOMPUTE_LOOKBACK_HOURS = int(os.getenv("SUMMARY_PRECOMPUTE_LOOKBACK_HOURS", "24"))
+
+# ---------- Transcription ----------
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", str(50 * 1024 * 1024)))
+TRANSCRIBE_SEGMENT_SECONDS = int(os.getenv("TRANSCRIBE_SEGMENT_SECONDS", "120"))
+TRANSCRIBE_OVERLAP_SECONDS = int(os.getenv("TRANSCRIBE_OVERLAP_SECONDS", "5"))
+TRANSCRIBE_MAX_PARALLEL = int(os.getenv("TRANSCRIBE_MAX_PARALLEL", "4"))
+TRANSCRIPT_CACHE_TTL_SECONDS = int(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+TRANSCRIPT_CACHE_MAX_ENTRIES = int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", "256"))
@@ -6,7 +6,10 @@ from app.database.mysql import (
     SettingsBase,
     SettingsDB,
     get_settings_db,
+    get_async_settings_db,
     SettingsSessionLocal,
+    AsyncSettingsSessionLocal,
+    close_settings_engines,
 )
 from app.database.redis import (
     get_redis_client,
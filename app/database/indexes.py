@@ -0,0 +1,137 @@
+import sys
+import asyncio
+import argparse
+import logging
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from app.database.mongodb import mongo_db, chat_sessions_collection
+from app.database.queries import (
+    LIVE_SESSIONS, SESSION_LIST_KEYS, MESSAGE_LIST_KEYS,
+    NEWEST_MESSAGES_SORT, HISTORY_TAIL_SORT, SEQ_SORT, IDLE_SESSIONS_SORT,
+    session_by_id, session_messages, seq_range, idle_sessions_to_summarize, messages_after_summary,
+)
+from app.services.pagination import keyset_sort, page_filter
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "chat_sessions": [
+        IndexModel([("session_id", ASCENDING)], name="session_id_unique", unique=True),
+        IndexModel(
+            [("updated_at", DESCENDING), ("session_id", DESCENDING)],
+            name="live_sessions_by_updated_at",
+            partialFilterExpression=LIVE_SESSIONS,
+        ),
+    ],
+    "chat_messages": [
+        # History tail and compaction ranges (seq order).
+        IndexModel(
+            [("session_id", ASCENDING), ("seq", DESCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)],
+            name="session_seq",
+        ),
+        # Session view and summary watermark (creation order).
+        IndexModel(
+            [("session_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)],
+            name="session_created_at",
+        ),
+    ],
+}
+
+# Every query the routers and services run, built with the same helpers and
+# sample values, for the `check` command.
+_T = datetime(2000, 1, 1)
+_ID = ObjectId("000000000000000000000000")
+_PLAN_CHECKS = [
+    ("list sessions", "chat_sessions", LIVE_SESSIONS, keyset_sort(SESSION_LIST_KEYS)),
+    ("list sessions page", "chat_sessions",
+     page_filter(LIVE_SESSIONS, SESSION_LIST_KEYS, [_T, "x"]), keyset_sort(SESSION_LIST_KEYS)),
+    ("session by id", "chat_sessions", session_by_id("x"), None),
+    ("idle sessions to summarize", "chat_sessions", idle_sessions_to_summarize(_T, _T), IDLE_SESSIONS_SORT),
+    ("history tail", "chat_messages", session_messages("x"), HISTORY_TAIL_SORT),
+    ("compaction range", "chat_messages", seq_range("x", 0, 10), SEQ_SORT),
+    ("session messages", "chat_messages", session_messages("x"), keyset_sort(MESSAGE_LIST_KEYS)),
+    ("session messages page", "chat_messages",
+     page_filter(session_messages("x"), MESSAGE_LIST_KEYS, [_T, _ID]), keyset_sort(MESSAGE_LIST_KEYS)),
+    ("latest message", "chat_messages", session_messages("x"), NEWEST_MESSAGES_SORT),
+    ("messages after summary", "chat_messages", *messages_after_summary("x", {"upto_seq": 1})),
+    ("messages after legacy summary", "chat_messages",
+     *messages_after_summary("x", {"upto_id": _ID, "upto_created_at": _T})),
+]
+
+
+async def _backfill_is_deleted() -> None:
+    # Raises on failure: sessions without is_deleted would silently drop out
+    # of the session list (LIVE_SESSIONS), so startup must not go on.
+    result = await chat_sessions_collection.update_many(
+        {"is_deleted": {"$exists": False}},
+        {"$set": {"is_deleted": False}},
+    )
+    if result.modified_count:
+        logger.info("Marked %d legacy sessions as not deleted", result.modified_count)
+
+
+async def ensure_indexes() -> None:
+    """
+    Backfill is_deleted on legacy sessions, then create the registered
+    indexes. Safe to run on every start: existing indexes with the same
+    definition are left alone. An index that cannot be built (e.g. duplicate
+    session ids) is logged and skipped; a failed backfill raises.
+    """
+    await _backfill_is_deleted()
+    for collection_name, models in INDEXES.items():
+        collection = mongo_db[collection_name]
+        for model in models:
+            try:
+                await collection.create_indexes([model])
+            except OperationFailure as e:
+                logger.error("Could not create index %s on %s: %s", model.document["name"], collection_name, e)
+
+
+def _stages(plan) -> list[str]:
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _stages(item)]
+    if not isinstance(plan, dict):
+        return []
+    stages = [plan["stage"]] if "stage" in plan else []
+    for value in plan.values():
+        stages.extend(_stages(value))
+    return stages
+
+
+async def check_query_plans() -> list[str]:
+    """Explain every registered query; return the names of those that scan a whole collection."""
+    failures = []
+    for name, collection_name, query, sort in _PLAN_CHECKS:
+        cursor = mongo_db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        stages = _stages(explain["queryPlanner"]["winningPlan"])
+        status = "COLLSCAN" if "COLLSCAN" in stages else "ok"
+        print(f"{status:8} {name}: {' <- '.join(stages)}")
+        if status != "ok":
+            failures.append(name)
+    return failures
+
+
+async def _main() -> int:
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("apply", help="create missing indexes")
+    sub.add_parser("check", help="explain the app's queries and fail on collection scans")
+    args = parser.parse_args()
+
+    if args.command == "apply":
+        await ensure_indexes()
+        return 0
+    failures = await check_query_plans()
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
@@ -1,11 +1,31 @@
 from sqlalchemy import create_engine, Column, Integer, String, TIMESTAMP
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
-from app.config import SETTINGS_MYSQL_URL
+from typing import AsyncIterator
+from app.config import (
+    SETTINGS_MYSQL_URL, SETTINGS_MYSQL_ASYNC_URL,
+    MYSQL_POOL_SIZE, MYSQL_MAX_OVERFLOW, MYSQL_POOL_TIMEOUT_SECONDS,
+    MYSQL_POOL_RECYCLE_SECONDS, MYSQL_POOL_PRE_PING,
+)
 
-settings_engine = create_engine(SETTINGS_MYSQL_URL)
+_POOL_OPTIONS = {
+    "pool_size": MYSQL_POOL_SIZE,
+    "max_overflow": MYSQL_MAX_OVERFLOW,
+    "pool_timeout": MYSQL_POOL_TIMEOUT_SECONDS,
+    "pool_recycle": MYSQL_POOL_RECYCLE_SECONDS,
+    "pool_pre_ping": MYSQL_POOL_PRE_PING,
+}
+
+# Blocking engine, kept for scripts and migrations.
+settings_engine = create_engine(SETTINGS_MYSQL_URL, **_POOL_OPTIONS)
 SettingsSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=settings_engine)
+
+# Used by request handlers so MySQL latency never blocks the event loop.
+async_settings_engine = create_async_engine(SETTINGS_MYSQL_ASYNC_URL, **_POOL_OPTIONS)
+AsyncSettingsSessionLocal = async_sessionmaker(async_settings_engine, autoflush=False, expire_on_commit=False)
+
 SettingsBase = declarative_base()
 
 
@@ -26,3 +46,13 @@ def get_settings_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_settings_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSettingsSessionLocal() as db:
+        yield db
+
+
+async def close_settings_engines() -> None:
+    await async_settings_engine.dispose()
+    settings_engine.dispose()
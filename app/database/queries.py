@@ -0,0 +1,69 @@
+"""
+Filters and sort orders of the app's MongoDB queries. Routers and services
+build their queries from these, and indexes.check_query_plans explains the
+same builders, so the plan check always covers the queries the app runs.
+"""
+from datetime import datetime
+from typing import Optional
+
+# Live sessions carry is_deleted: False explicitly (backfilled at startup by
+# indexes.ensure_indexes) so the session list can use a partial index.
+LIVE_SESSIONS = {"is_deleted": False}
+
+SESSION_LIST_KEYS = ["updated_at", "session_id"]
+MESSAGE_LIST_KEYS = ["created_at", "_id"]
+
+NEWEST_MESSAGES_SORT = [("created_at", -1), ("_id", -1)]
+HISTORY_TAIL_SORT = [("seq", -1), ("created_at", -1), ("_id", -1)]
+SEQ_SORT = [("seq", -1)]
+IDLE_SESSIONS_SORT = [("updated_at", -1)]
+
+
+def session_by_id(session_id: str) -> dict:
+    """A session that has not been deleted (legacy ones may lack is_deleted)."""
+    return {"session_id": session_id, "is_deleted": {"$ne": True}}
+
+
+def session_messages(session_id: str) -> dict:
+    return {"session_id": session_id}
+
+
+def seq_range(session_id: str, after: int, upto: Optional[int] = None) -> dict:
+    """Messages with after < seq (<= upto)."""
+    seq = {"$gt": after}
+    if upto is not None:
+        seq["$lte"] = upto
+    return {"session_id": session_id, "seq": seq}
+
+
+def idle_sessions_to_summarize(idle_before: datetime, active_after: datetime) -> dict:
+    return {
+        **LIVE_SESSIONS,
+        "updated_at": {"$lt": idle_before, "$gt": active_after},
+        # No summary yet, or messages were added after the last one it covers.
+        "$or": [
+            {"summary": {"$exists": False}},
+            {"$expr": {"$lt": [{"$ifNull": ["$summary.upto_seq", -1]}, {"$ifNull": ["$message_seq", -1]}]}},
+        ],
+    }
+
+
+def messages_after_summary(session_id: str, summary: Optional[dict]) -> tuple[dict, list]:
+    """
+    (filter, sort) of the messages past a summary's watermark, newest first.
+    The watermark is the seq of the last message covered. Streamed turns are
+    written after the answer ends but keep the request's created_at, so only
+    seq orders them reliably; the (created_at, _id) watermark is still used
+    for summaries of messages that predate seq.
+    """
+    if summary and summary.get("upto_seq") is not None:
+        return seq_range(session_id, summary["upto_seq"]), SEQ_SORT
+
+    query = session_messages(session_id)
+    if summary and summary.get("upto_id") is not None:
+        upto_created_at = summary["upto_created_at"]
+        query["$or"] = [
+            {"created_at": {"$gt": upto_created_at}},
+            {"created_at": upto_created_at, "_id": {"$gt": summary["upto_id"]}},
+        ]
+    return query, NEWEST_MESSAGES_SORT
@@ -1,64 +1,183 @@
-import os
 import uuid
-import shutil
+import hashlib
 import logging
 import asyncio
 from datetime import datetime
 from typing import Optional, List
 
-from fastapi import APIRouter, HTTPException, Depends, Form, File, UploadFile
-from sqlalchemy.orm import Session
-import google.generativeai as genai
+from fastapi import APIRouter, HTTPException, Form, File, UploadFile
+from fastapi.responses import StreamingResponse
 
 from app.config import (
     GEMINI_API_KEY, GEMINI_DEFAULT_MODEL,
-    UPLOAD_DIR, ALLOWED_IMAGE_MIME, ALLOWED_AUDIO_MIME,
-    LANGUAGE_INSTRUCTIONS,
-)
-from app.database import (
-    get_settings_db,
-    SettingsDB,
-    SettingsSessionLocal,
-    chat_sessions_collection,
-    chat_messages_collection,
+    ALLOWED_IMAGE_MIME, ALLOWED_AUDIO_MIME, MAX_IMAGE_BYTES, MAX_AUDIO_BYTES,
+    UPLOAD_CHUNK_BYTES, LANGUAGE_INSTRUCTIONS,
 )
+from app.database import chat_sessions_collection
+from app.database.queries import session_by_id
+from app.services.streaming import sse_event
+from app.services.gemini_client import get_model, send_message, stream_text
+from app.services.chat_history import load_recent_history, reserve_seq, append_messages
+from app.services.context_builder import build_context, estimate_tokens, schedule_compaction
+from app.services.uploads import save_image_upload, UploadTooLarge
+from app.services.transcription import transcribe_audio
+from app.services.settings_cache import get_settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+_background_tasks: set[asyncio.Task] = set()
+
 
 async def _transcribe_audio_bytes(
     audio_bytes: bytes,
+    digest: str,
     base_mime: str,
     api_key: Optional[str] = None,
     model: Optional[str] = None,
 ) -> dict:
-    db = SettingsSessionLocal()
-    try:
-        settings = db.query(SettingsDB).filter(SettingsDB.id == 1).first()
-    finally:
-        db.close()
+    settings = await get_settings()
 
     key = api_key or (settings.api_key if settings and settings.api_key else None) or GEMINI_API_KEY
     model_name = model or (settings.model if settings else None) or GEMINI_DEFAULT_MODEL
 
-    genai.configure(api_key=key)
-
     mime = base_mime
     if mime == "audio/mp3":
         mime = "audio/mpeg"
 
-    gen_model = genai.GenerativeModel(model_name=model_name)
-    response = await asyncio.to_thread(
-        gen_model.generate_content,
-        [
-            "Transcribe this audio exactly as spoken. Return ONLY the transcript text, nothing else. No labels, no quotes, no explanations.",
-            {"mime_type": mime, "data": audio_bytes},
-        ],
-    )
-    transcript = response.text.strip() if response.text else ""
+    transcript = await transcribe_audio(audio_bytes, digest, mime, key, model_name)
     return {"transcript": transcript}
 
+async def _prepare_chat(
+    message: str,
+    session_id: Optional[str],
+    api_key: Optional[str],
+    model: Optional[str],
+    language: Optional[str],
+    images: List[UploadFile],
+) -> tuple:
+    """
+    Resolve the session, rebuild the trimmed history and store the uploaded
+    images. Returns (chat, parts, session_id, is_new_session, now, saved_images).
+    """
+    settings = await get_settings()
+    context_limit = settings.context_messages if settings else 4
+
+    is_new_session = False
+    message_seq = 0
+    context_summary = None
+    if session_id:
+        doc = await chat_sessions_collection.find_one(
+            session_by_id(session_id),
+            {"message_seq": 1, "context_summary": 1},
+        )
+        if not doc:
+            # Session ids are unique, so a deleted session's id cannot be reused.
+            session_id = str(uuid.uuid4())
+            is_new_session = True
+        else:
+            message_seq = doc.get("message_seq", 0)
+            context_summary = doc.get("context_summary")
+    else:
+        session_id = str(uuid.uuid4())
+        is_new_session = True
+
+    history = []
+    # context_messages caps how many exchanges are considered; the token
+    # budget then decides how much of them fits.
+    if not is_new_session and context_limit > 0:
+        entries = await load_recent_history(session_id, message_seq, context_limit * 2)
+        history, compact_upto = build_context(entries, context_summary)
+        if compact_upto:
+            schedule_compaction(session_id, compact_upto, api_key, model)
+
+    lang = language or "ar"
+    lang_instruction = LANGUAGE_INSTRUCTIONS.get(lang, f"Answer in {lang} only.")
+
+    system_prompt = (
+        "You are a professional AI assistant.\n"
+        f"{lang_instruction}\n"
+        "Keep answers clear and well structured.\n"
+        "If a limit is required, keep response under 300 words."
+    )
+
+    gen_model = get_model(api_key, model, system_instruction=system_prompt)
+
+    chat = gen_model.start_chat(history=history)
+
+    now = datetime.utcnow()
+    saved_images = []
+    parts = []
+
+    for img in images:
+        if not img.filename:
+            continue
+        if img.content_type not in ALLOWED_IMAGE_MIME:
+            raise HTTPException(
+                status_code=400,
+                detail=f"نوع الملف {img.filename} غير مدعوم. يُسمح بـ JPEG, PNG, GIF, WEBP فقط.",
+            )
+
+        try:
+            image_info, image_bytes = await save_image_upload(img, MAX_IMAGE_BYTES, now)
+        except UploadTooLarge:
+            raise HTTPException(
+                status_code=413,
+                detail=f"حجم الملف {img.filename} يتجاوز الحد المسموح ({MAX_IMAGE_BYTES // (1024 * 1024)} ميغابايت).",
+            )
+        saved_images.append(image_info)
+        parts.append({"mime_type": img.content_type, "data": image_bytes})
+
+    if message:
+        parts.append(message)
+
+    return chat, parts, session_id, is_new_session, now, saved_images
+
+
+async def _persist_exchange(
+    session_id: str,
+    is_new_session: bool,
+    now: datetime,
+    message: str,
+    saved_images: list,
+    answer: str,
+    partial: bool = False,
+) -> None:
+    user_doc = {
+        "session_id": session_id,
+        "role": "user",
+        "text": message,
+        "token_count": estimate_tokens(message),
+        "images": saved_images,
+        "created_at": now,
+        "updated_at": now,
+    }
+    bot_doc = {
+        "session_id": session_id,
+        "role": "bot",
+        "text": answer,
+        "token_count": estimate_tokens(answer),
+        "images": [],
+        "created_at": now,
+        "updated_at": now,
+    }
+    if partial:
+        bot_doc["partial"] = True
+
+    seq = await reserve_seq(session_id, [user_doc, bot_doc], now, title=message[:60].strip())
+    user_doc["seq"] = seq
+    bot_doc["seq"] = seq + 1
+    await append_messages(session_id, [user_doc, bot_doc], new_session=is_new_session)
+
+
+def _persist_in_background(*args, **kwargs) -> asyncio.Task:
+    """Persist on a detached task so a client disconnect cannot cancel the write."""
+    task = asyncio.create_task(_persist_exchange(*args, **kwargs))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
 #chat with the model , images included
 @router.post("/chat")
 async def chat_with_gpt(
@@ -68,149 +187,98 @@ async def chat_with_gpt(
     model: Optional[str] = Form(None),
     language: Optional[str] = Form(None),
     images: List[UploadFile] = File([]),
-    db: Session = Depends(get_settings_db),
 ):
     try:
-        key = api_key or GEMINI_API_KEY
-        model_name = model or GEMINI_DEFAULT_MODEL
-        genai.configure(api_key=key)
-
-        settings = db.query(SettingsDB).filter(SettingsDB.id == 1).first()
-        context_limit = settings.context_messages if settings else 4
-
-        is_new_session = False
-        if session_id:
-            doc = await chat_sessions_collection.find_one(
-                {"session_id": session_id, "is_deleted": {"$ne": True}}
-            )
-            if not doc:
-                is_new_session = True
-        else:
-            session_id = str(uuid.uuid4())
-            is_new_session = True
-
-        full_history = []
-        if not is_new_session:
-            cursor = chat_messages_collection.find(
-                {"session_id": session_id}, {"_id": 0, "role": 1, "text": 1}
-            ).sort("created_at", 1) #sort the messages by the created_at field in ascending order (oldest to newest) , -1 for descending order (newest to oldest)
-            async for msg in cursor:
-                full_history.append({"role": msg["role"], "text": msg["text"]})
-
-        trimmed_history = []
-        if full_history and context_limit > 0:
-            max_entries = context_limit * 2
-            trimmed_history = full_history[-max_entries:]
-
-        lang = language or "ar"
-        lang_instruction = LANGUAGE_INSTRUCTIONS.get(lang, f"Answer in {lang} only.")
-
-        system_prompt = (
-            "You are a professional AI assistant.\n"
-            f"{lang_instruction}\n"
-            "Keep answers clear and well structured.\n"
-            "If a limit is required, keep response under 300 words."
-        )
-
-        gen_model = genai.GenerativeModel(
-            model_name=model_name,
-            system_instruction=system_prompt,
+        chat, parts, session_id, is_new_session, now, saved_images = await _prepare_chat(
+            message, session_id, api_key, model, language, images
         )
 
-        history = []
-        for msg in trimmed_history:
-            role = "user" if msg["role"] == "user" else "model"
-            history.append({"role": role, "parts": [msg["text"]]})
-
-        chat = gen_model.start_chat(history=history)
-
-        now = datetime.utcnow()
-        saved_images = []
-        parts = []
-
-        for img in images:
-            if not img.filename:
-                continue
-            if img.content_type not in ALLOWED_IMAGE_MIME:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"نوع الملف {img.filename} غير مدعوم. يُسمح بـ JPEG, PNG, GIF, WEBP فقط.",
-                )
-
-            ext = os.path.splitext(img.filename)[1] or ".jpg"
-            filename = f"{uuid.uuid4().hex}{ext}"
-            filepath = os.path.join(UPLOAD_DIR, filename)
-
-            with open(filepath, "wb") as buf:
-                shutil.copyfileobj(img.file, buf)
-
-            file_size = os.path.getsize(filepath)
-            saved_images.append({
-                "path": f"/uploads/{filename}",
-                "filename": filename,
-                "content_type": img.content_type,
-                "size": file_size,
-                "uploaded_at": now,
-            })
-
-            image_bytes = open(filepath, "rb").read()
-            parts.append({"mime_type": img.content_type, "data": image_bytes})
-
-        if message:
-            parts.append(message)
-
-        response = chat.send_message(parts)
+        response = await send_message(chat, parts)
         answer = response.text if response.text else "لم يتم توليد رد."
 
-        if is_new_session:
-            await chat_sessions_collection.insert_one({
-                "session_id": session_id,
-                "title": message[:60].strip(),
-                "created_at": now,
-                "updated_at": now,
-            })
+        await _persist_exchange(session_id, is_new_session, now, message, saved_images, answer)
 
-        user_doc = {
+        return {
+            "message": message,
+            "response": answer,
             "session_id": session_id,
-            "role": "user",
-            "text": message,
             "images": saved_images,
-            "created_at": now,
-            "updated_at": now,
         }
-        bot_doc = {
-            "session_id": session_id,
-            "role": "bot",
-            "text": answer,
-            "images": [],
-            "created_at": now,
-            "updated_at": now,
-        }
-        await chat_messages_collection.insert_many([user_doc, bot_doc])
 
-        if not is_new_session:
-            await chat_sessions_collection.update_one(
-                {"session_id": session_id},
-                {"$set": {"updated_at": now}},
-            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Gemini chat error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Gemini API Error: {str(e)}")
 
-        return {
+
+async def _chat_events(chat, parts, session_id, is_new_session, now, message, saved_images):
+    """
+    SSE events for one streamed chat turn: "session", then "token" per chunk
+    and finally "done" (or "error"). Both messages are written once the stream
+    ends; if it is cut short (client gone or model error) whatever was
+    generated is saved with partial=True.
+    """
+    yield sse_event("session", {"session_id": session_id, "images": saved_images})
+
+    pieces = []
+    finished = False
+    try:
+        async for text in stream_text(lambda: chat.send_message(parts, stream=True)):
+            pieces.append(text)
+            yield sse_event("token", {"text": text})
+
+        answer = "".join(pieces) or "لم يتم توليد رد."
+        finished = True
+        await asyncio.shield(
+            _persist_in_background(session_id, is_new_session, now, message, saved_images, answer)
+        )
+        yield sse_event("done", {
             "message": message,
             "response": answer,
             "session_id": session_id,
             "images": saved_images,
-        }
+        })
+    except Exception as e:
+        logger.error("Gemini chat stream error: %s", e)
+        yield sse_event("error", {"detail": f"Gemini API Error: {str(e)}"})
+    finally:
+        if not finished and pieces:
+            logger.info("Chat stream for session %s ended early, saving partial answer", session_id)
+            _persist_in_background(
+                session_id, is_new_session, now, message, saved_images, "".join(pieces), partial=True
+            )
+
 
+@router.post("/chat/stream")
+async def chat_with_gpt_stream(
+    message: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    api_key: Optional[str] = Form(None),
+    model: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+    images: List[UploadFile] = File([]),
+):
+    try:
+        chat, parts, session_id, is_new_session, now, saved_images = await _prepare_chat(
+            message, session_id, api_key, model, language, images
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.error("Gemini chat error: %s", e)
         raise HTTPException(status_code=500, detail=f"Gemini API Error: {str(e)}")
 
+    return StreamingResponse(
+        _chat_events(chat, parts, session_id, is_new_session, now, message, saved_images),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
 #transcribe audio
 @router.post("/transcribe")
-async def transcribe_audio(
+async def transcribe(
     audio: UploadFile = File(...),
     api_key: Optional[str] = Form(None),
     model: Optional[str] = Form(None),
@@ -224,9 +292,21 @@ async def transcribe_audio(
             detail=f"نوع الملف الصوتي غير مدعوم: {raw_mime}",
         )
 
+    hasher = hashlib.sha256()
+    chunks = []
+    size = 0
+    while chunk := await audio.read(UPLOAD_CHUNK_BYTES):
+        size += len(chunk)
+        if size > MAX_AUDIO_BYTES:
+            raise HTTPException(status_code=413, detail="حجم الملف الصوتي كبير جداً")
+        hasher.update(chunk)
+        chunks.append(chunk)
+
     try:
-        audio_bytes = await audio.read()
-        return await _transcribe_audio_bytes(audio_bytes, base_mime, api_key=api_key, model=model)
+        audio_bytes = b"".join(chunks)
+        return await _transcribe_audio_bytes(
+            audio_bytes, hasher.hexdigest(), base_mime, api_key=api_key, model=model,
+        )
     except HTTPException:
         raise
     except Exception as e:
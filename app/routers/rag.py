@@ -1,68 +1,167 @@
+import json
+import asyncio
+import hashlib
 import logging
+from typing import Awaitable, Callable, Optional
 
 from fastapi import APIRouter, HTTPException
-import google.generativeai as genai
+from fastapi.responses import StreamingResponse
 
-from app.config import GEMINI_API_KEY, GEMINI_DEFAULT_MODEL
+from app.config import (
+    GEMINI_DEFAULT_MODEL,
+    RAG_ANSWER_CACHE_TTL_SECONDS, RAG_ANSWER_CACHE_MAX_ENTRIES,
+    RAG_LOCK_TTL_SECONDS, RAG_LOCK_WAIT_SECONDS, RAG_LOCK_POLL_SECONDS,
+    SEARCH_INDEX_ENABLED, SEARCH_INDEX_MIN_COVERAGE,
+)
 from app.schemas import RAGRequest, RAGResponse, LinkInfo
-from app.services.scraper import WEBSITES, search_serper, scrape_page_content, clean_gemini_response
+from app.services.cache import TwoTierCache, SingleFlight, try_lock, release_lock
+from app.services.scraper import (
+    WEBSITES, search_serper, scrape_pages, clean_gemini_response, normalize_query, resolve_websites,
+    get_host_states, IncrementalMarkdownCleaner,
+)
+from app.services.search_index import get_search_index
+from app.services.passages import select_passages, rank_sources
+from app.services.streaming import sse_event
+from app.services.gemini_client import get_model, generate_content, stream_text
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+_answer_cache = TwoTierCache("rag-answer", max_entries=RAG_ANSWER_CACHE_MAX_ENTRIES)
+_answer_flights = SingleFlight()
+_background_tasks: set[asyncio.Task] = set()
 
-async def _run_rag_query(request: RAGRequest):
-    try:
-        site_config = WEBSITES.get(request.website, WEBSITES["altibbi"])
-        site_name = site_config["name"]
+EventCallback = Optional[Callable[[str, dict], Awaitable[None]]]
 
-        search_results = search_serper(request.query, website=request.website, num_links=request.num_links)
 
-        if not search_results:
-            raise HTTPException(
-                status_code=404,
-                detail=f"لم يتم العثور على محتوى من {site_name}. حاول استخدام مصطلحات أخرى.",
-            )
+def _index_sources(website: str, sources: list[dict]) -> None:
+    """Feed freshly scraped pages into the local index without delaying the response."""
+    index = get_search_index()
 
-        scraped_sources = []
-        for result in search_results:
-            content = scrape_page_content(result["url"])
-            if content and len(content) >= 100 and content.count("\ufffd") <= 10:
-                scraped_sources.append({
-                    "url": result["url"],
-                    "title": result["title"],
-                    "snippet": result["snippet"],
-                    "content": content,
-                })
-
-        if not scraped_sources:
-            raise HTTPException(
-                status_code=500,
-                detail=f"فشل في استخراج المحتوى الكافي من {site_name}",
-            )
+    async def add_all():
+        for source in sources:
+            try:
+                await asyncio.to_thread(index.add_document, source["url"], website, source["title"], source["content"])
+            except Exception as e:
+                logger.warning("Indexing failed for %s: %s", source["url"], e)
+
+    task = asyncio.create_task(add_all())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def _retrieve_site(
+    query: str, website: str, num_links: int, on_event: EventCallback = None
+) -> tuple[int, list[dict], str]:
+    """
+    Return (candidate link count, usable sources, backend label) for one website.
+    The local BM25 index is tried first; Serper plus live scraping is only
+    used when the index has too few sufficiently matching pages.
+    `on_event` receives progress events ("links", "source") for streaming.
+    """
+    if SEARCH_INDEX_ENABLED:
+        try:
+            hits = await asyncio.to_thread(get_search_index().search, query, website, num_links)
+        except Exception as e:
+            logger.warning("Local index search failed: %s", e)
+            hits = []
+        hits = [hit for hit in hits if hit["coverage"] >= SEARCH_INDEX_MIN_COVERAGE]
+        if len(hits) >= num_links:
+            logger.info("Local index hit for %s: %s", website, query)
+            if on_event:
+                await on_event("links", {"website": website, "links": [
+                    {"url": hit["url"], "title": hit["title"]} for hit in hits
+                ]})
+            return len(hits), hits, "local index"
+
+    search_results = await search_serper(query, website=website, num_links=num_links)
+    if not search_results:
+        return 0, [], "Google Serper API"
+
+    if on_event:
+        await on_event("links", {"website": website, "links": [
+            {"url": result["url"], "title": result["title"]} for result in search_results
+        ]})
+
+    async def report_page(index: int, content: str) -> None:
+        result = search_results[index]
+        await on_event("source", {"url": result["url"], "title": result["title"], "ok": len(content) >= 100})
+
+    contents = await scrape_pages(
+        [result["url"] for result in search_results],
+        on_page=report_page if on_event else None,
+    )
+
+    scraped_sources = []
+    for result, content in zip(search_results, contents):
+        if content and len(content) >= 100 and content.count("\ufffd") <= 10:
+            scraped_sources.append({
+                "url": result["url"],
+                "title": result["title"],
+                "snippet": result["snippet"],
+                "content": content,
+            })
+
+    if scraped_sources and SEARCH_INDEX_ENABLED:
+        _index_sources(website, scraped_sources)
+
+    return len(search_results), scraped_sources, "Google Serper API"
 
-        used_links = [
-            LinkInfo(url=s["url"], title=s["title"], snippet=s["snippet"])
-            for s in scraped_sources
-        ]
 
-        api_key = request.api_key or GEMINI_API_KEY
-        model_name = request.model or GEMINI_DEFAULT_MODEL
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(model_name)
+def _url_identity(url: str) -> str:
+    bare = url.split("#", 1)[0].split("://", 1)[-1]
+    if bare.startswith("www."):
+        bare = bare[4:]
+    return bare.rstrip("/")
 
-        context_blocks = []
-        for i, source in enumerate(scraped_sources, 1):
-            context_blocks.append(f"[مصدر {i}] ({source['url']})\n{source['content']}")
 
-        combined_context = "\n\n---\n\n".join(context_blocks)
+async def _retrieve_sources(
+    request: RAGRequest, sites: list[str], site_name: str, on_event: EventCallback = None
+) -> tuple[list[dict], str]:
+    """
+    Retrieve from every requested site concurrently, then dedupe by URL.
+    With several sites the merged list is ranked by passage relevance;
+    a single site keeps its search order.
+    """
+    results = await asyncio.gather(*(
+        _retrieve_site(request.query, site, request.num_links, on_event) for site in sites
+    ))
 
-        rag_prompt = f"""أنت مساعد طبي متخصص. أجب على السؤال بناءً فقط على المصادر المقدمة أدناه من {site_name}.
+    if not sum(found for found, _, _ in results):
+        raise HTTPException(
+            status_code=404,
+            detail=f"لم يتم العثور على محتوى من {site_name}. حاول استخدام مصطلحات أخرى.",
+        )
+
+    sources = []
+    seen = set()
+    for _, site_sources, _ in results:
+        for source in site_sources:
+            identity = _url_identity(source["url"])
+            if identity not in seen:
+                seen.add(identity)
+                sources.append(source)
+
+    if len(sites) > 1:
+        sources = await asyncio.to_thread(rank_sources, request.query, sources)
+
+    backend = " + ".join(dict.fromkeys(label for found, _, label in results if found))
+    return sources, backend
+
+
+def _build_rag_prompt(site_name: str, context_sources: list[dict], query: str) -> str:
+    context_blocks = []
+    for i, source in enumerate(context_sources, 1):
+        context_blocks.append(f"[مصدر {i}] ({source['url']})\n{source['content']}")
+
+    combined_context = "\n\n---\n\n".join(context_blocks)
+
+    return f"""أنت مساعد طبي متخصص. أجب على السؤال بناءً فقط على المصادر المقدمة أدناه من {site_name}.
 
 المصادر:
 {combined_context}
 
-السؤال: {request.query}
+السؤال: {query}
 
 التعليمات:
 - أجب بالعربية الفصحى بشكل واضح ومنظم
@@ -73,8 +172,37 @@ async def _run_rag_query(request: RAGRequest):
 
 الإجابة:"""
 
+
+async def _prepare_rag(request: RAGRequest, on_event: EventCallback = None) -> tuple[str, list[LinkInfo], str]:
+    """Retrieve and rank sources, returning (source label, used links, prompt)."""
+    sites = resolve_websites(request.website)
+    site_name = "، ".join(WEBSITES[site]["name"] for site in sites)
+
+    scraped_sources, backend = await _retrieve_sources(request, sites, site_name, on_event)
+
+    if not scraped_sources:
+        raise HTTPException(
+            status_code=500,
+            detail=f"فشل في استخراج المحتوى الكافي من {site_name}",
+        )
+
+    used_links = [
+        LinkInfo(url=s["url"], title=s["title"], snippet=s["snippet"])
+        for s in scraped_sources
+    ]
+
+    context_sources = await asyncio.to_thread(select_passages, request.query, scraped_sources)
+    prompt = _build_rag_prompt(site_name, context_sources, request.query)
+    return f"{site_name} (via {backend})", used_links, prompt
+
+
+async def _run_rag_query(request: RAGRequest):
+    try:
+        source, used_links, rag_prompt = await _prepare_rag(request)
+        model = get_model(request.api_key, request.model)
+
         try:
-            response = model.generate_content(rag_prompt)
+            response = await generate_content(model, rag_prompt)
             raw_answer = response.text if response.text else "لم يتم توليد رد"
             cleaned_answer = clean_gemini_response(raw_answer)
         except Exception as gemini_error:
@@ -83,7 +211,7 @@ async def _run_rag_query(request: RAGRequest):
 
         return RAGResponse(
             query=request.query,
-            source=f"{site_name} (via Google Serper API)",
+            source=source,
             response=cleaned_answer,
             used_links=used_links,
         )
@@ -95,6 +223,138 @@ async def _run_rag_query(request: RAGRequest):
         raise HTTPException(status_code=500, detail=f"خطأ غير متوقع: {str(e)}")
 
 
+def _answer_cache_key(request: RAGRequest) -> str:
+    parts = [
+        normalize_query(request.query),
+        sorted(resolve_websites(request.website)),
+        request.num_links,
+        request.model or GEMINI_DEFAULT_MODEL,
+    ]
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+async def _run_rag_query_once(key: str, request: RAGRequest) -> RAGResponse:
+    """
+    Run the pipeline for a cache miss, at most once across workers.
+    Another worker holding the Redis lock for the same key is waited on until
+    its answer lands in the cache; if it takes too long we compute it ourselves.
+    """
+    loop = asyncio.get_running_loop()
+    wait_until = loop.time() + RAG_LOCK_WAIT_SECONDS
+    lock_name = f"rag:{key}"
+
+    token = await try_lock(lock_name, RAG_LOCK_TTL_SECONDS)
+    while token is None and loop.time() < wait_until:
+        await asyncio.sleep(RAG_LOCK_POLL_SECONDS)
+        cached = await _answer_cache.get(key)
+        if cached is not None:
+            return RAGResponse(**cached)
+        token = await try_lock(lock_name, RAG_LOCK_TTL_SECONDS)
+
+    try:
+        cached = await _answer_cache.get(key)
+        if cached is not None:
+            return RAGResponse(**cached)
+
+        response = await _run_rag_query(request)
+        await _answer_cache.set(key, response.model_dump(), RAG_ANSWER_CACHE_TTL_SECONDS)
+        return response
+    finally:
+        if token:
+            await release_lock(lock_name, token)
+
+
+async def _cached_rag_query(request: RAGRequest) -> RAGResponse:
+    key = _answer_cache_key(request)
+    cached = await _answer_cache.get(key)
+    if cached is not None:
+        logger.info("RAG answer cache hit: %s", request.query)
+        return RAGResponse(**cached)
+    return await _answer_flights.do(key, lambda: _run_rag_query_once(key, request))
+
+
 @router.post("/query", response_model=RAGResponse)
 async def rag_query(request: RAGRequest):
-    return await _run_rag_query(request)
\ No newline at end of file
+    return await _cached_rag_query(request)
+
+
+async def _rag_events(request: RAGRequest):
+    """
+    Produce the SSE events for one streamed RAG query.
+    Retrieval progress ("links", "source") is forwarded as it happens, then
+    the answer arrives as "token" events and a final "done" event carrying
+    the same payload as POST /rag/query. Failures end with an "error" event.
+    """
+    key = _answer_cache_key(request)
+    cached = await _answer_cache.get(key)
+    if cached is not None:
+        yield sse_event("done", cached)
+        return
+
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def on_event(event: str, data: dict) -> None:
+        await events.put(sse_event(event, data))
+
+    async def run() -> None:
+        try:
+            source, used_links, prompt = await _prepare_rag(request, on_event)
+            model = get_model(request.api_key, request.model)
+
+            cleaner = IncrementalMarkdownCleaner()
+            parts = []
+            try:
+                async for text in stream_text(lambda: model.generate_content(prompt, stream=True)):
+                    cleaned = cleaner.feed(text)
+                    if cleaned:
+                        parts.append(cleaned)
+                        await on_event("token", {"text": cleaned})
+            except Exception as gemini_error:
+                logger.error("Gemini API error: %s", gemini_error)
+                raise HTTPException(status_code=500, detail=f"خطأ في Gemini API: {str(gemini_error)}")
+
+            tail = cleaner.finish()
+            if tail:
+                parts.append(tail)
+                await on_event("token", {"text": tail})
+
+            response = RAGResponse(
+                query=request.query,
+                source=source,
+                response="".join(parts),
+                used_links=used_links,
+            )
+            await _answer_cache.set(key, response.model_dump(), RAG_ANSWER_CACHE_TTL_SECONDS)
+            await on_event("done", response.model_dump())
+        except HTTPException as e:
+            await on_event("error", {"status": e.status_code, "detail": e.detail})
+        except Exception as e:
+            logger.error("Unexpected RAG stream error: %s", e)
+            await on_event("error", {"status": 500, "detail": f"خطأ غير متوقع: {str(e)}"})
+        finally:
+            await events.put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                break
+            yield event
+    finally:
+        # Client went away: stop scraping / generating on its behalf.
+        task.cancel()
+
+
+@router.post("/query/stream")
+async def rag_query_stream(request: RAGRequest):
+    return StreamingResponse(
+        _rag_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/sources/health")
+async def sources_health():
+    return {"hosts": get_host_states()}
\ No newline at end of file
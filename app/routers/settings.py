@@ -1,14 +1,16 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_settings_db, SettingsDB
+from app.database import get_async_settings_db, SettingsDB
 from app.schemas import SettingsUpdate, SettingsResponse
+from app.services.settings_cache import settings_changed
 
 router = APIRouter()
 
 
-def get_or_create_settings(db: Session) -> SettingsDB:
-    settings = db.query(SettingsDB).filter(SettingsDB.id == 1).first()
+async def get_or_create_settings(db: AsyncSession) -> SettingsDB:
+    settings = await db.scalar(select(SettingsDB).where(SettingsDB.id == 1))
     if not settings:
         settings = SettingsDB(
             id=1,
@@ -18,19 +20,21 @@ def get_or_create_settings(db: Session) -> SettingsDB:
             context_messages=4,
         )
         db.add(settings)
-        db.commit()
-        db.refresh(settings)
+        await db.commit()
+        await db.refresh(settings)
+        # Workers that cached "no settings row" at startup reload now.
+        await settings_changed(SettingsResponse.model_validate(settings))
     return settings
 
 
 @router.get("/", response_model=SettingsResponse)
-def get_settings(db: Session = Depends(get_settings_db)):
-    return get_or_create_settings(db)
+async def get_settings(db: AsyncSession = Depends(get_async_settings_db)):
+    return await get_or_create_settings(db)
 
 
 @router.put("/", response_model=SettingsResponse)
-def update_settings(data: SettingsUpdate, db: Session = Depends(get_settings_db)):
-    settings = get_or_create_settings(db)
+async def update_settings(data: SettingsUpdate, db: AsyncSession = Depends(get_async_settings_db)):
+    settings = await get_or_create_settings(db)
 
     if data.api_key is not None:
         settings.api_key = data.api_key
@@ -41,6 +45,9 @@ def update_settings(data: SettingsUpdate, db: Session = Depends(get_settings_db)
     if data.context_messages is not None:
         settings.context_messages = data.context_messages
 
-    db.commit()
-    db.refresh(settings)
-    return settings
+    await db.commit()
+    await db.refresh(settings)
+
+    response = SettingsResponse.model_validate(settings)
+    await settings_changed(response)
+    return response
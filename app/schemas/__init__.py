@@ -5,6 +5,8 @@ from app.schemas.chat import (
     ChatRequest,
     ChatResponse,
     SessionSummary,
+    SessionListPage,
+    MessagePage,
     SessionDetail,
 )
 from app.schemas.rag import RAGRequest, LinkInfo, RAGResponse
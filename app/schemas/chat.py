@@ -9,6 +9,8 @@ class ImageInfo(BaseModel):
     content_type: str
     size: int
     uploaded_at: datetime
+    thumbnail_path: Optional[str] = None
+    preview_path: Optional[str] = None
 
 
 class ChatMessage(BaseModel):
@@ -17,6 +19,7 @@ class ChatMessage(BaseModel):
     text: str
     updated_at: Optional[datetime] = None
     images: Optional[List[ImageInfo]] = []
+    partial: bool = False
 
 
 class MessageUpdate(BaseModel):
@@ -42,6 +45,22 @@ class SessionSummary(BaseModel):
     session_id: str
     title: str
     updated_at: datetime
+    message_count: int = 0
+    image_count: int = 0
+    last_message_preview: str = ""
+    last_role: Optional[str] = None
+
+
+class SessionListPage(BaseModel):
+    sessions: List[SessionSummary]
+    older_cursor: Optional[str] = None
+    newer_cursor: Optional[str] = None
+
+
+class MessagePage(BaseModel):
+    messages: List[ChatMessage]
+    older_cursor: Optional[str] = None
+    newer_cursor: Optional[str] = None
 
 
 class SessionDetail(BaseModel):
@@ -50,3 +69,4 @@ class SessionDetail(BaseModel):
     messages: List[ChatMessage]
     created_at: datetime
     updated_at: datetime
+    older_cursor: Optional[str] = None
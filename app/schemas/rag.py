@@ -1,11 +1,14 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Union
 
 
 class RAGRequest(BaseModel):
     query: str
     num_links: int = Field(default=1, ge=1, le=10, description="Number of links to retrieve and send to the model")
-    website: str = Field(default="altibbi", description="Website to search: altibbi, mayoclinic, or mawdoo3")
+    website: Union[str, List[str]] = Field(
+        default="altibbi",
+        description="Website to search: altibbi, mayoclinic, mawdoo3, \"all\", or a list of these",
+    )
     api_key: Optional[str] = None
     model: Optional[str] = None
 
@@ -0,0 +1,183 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from app.config import REDIS_RETRY_SECONDS
+from app.database import get_redis_client
+
+logger = logging.getLogger(__name__)
+
+_redis_down_until = 0.0
+
+
+def get_cache_redis():
+    """
+    Return the shared Redis client, or None while Redis is known to be down.
+    After a failure Redis is skipped for REDIS_RETRY_SECONDS so an outage does
+    not add a connection attempt to every request.
+    """
+    if time.monotonic() < _redis_down_until:
+        return None
+    try:
+        return get_redis_client()
+    except RuntimeError as e:
+        mark_redis_down(e)
+        return None
+
+
+def mark_redis_down(error: Exception) -> None:
+    global _redis_down_until
+    if time.monotonic() >= _redis_down_until:
+        logger.warning("Redis unavailable, using in-process caches only: %s", error)
+    _redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+
+class LRUCache:
+    """In-process LRU cache with a per-entry TTL."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._data.pop(key, None)
+
+
+class TwoTierCache:
+    """
+    In-process LRU in front of Redis.
+    Values must be JSON-serialisable and never None (None means "miss").
+    Redis errors are logged and treated as misses, so the cache degrades to
+    the local tier when Redis is unavailable.
+    """
+
+    def __init__(self, namespace: str, max_entries: int):
+        self.namespace = namespace
+        self.local = LRUCache(max_entries)
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+
+        redis = get_cache_redis()
+        if redis is None:
+            return None
+        try:
+            raw = await redis.get(self._redis_key(key))
+        except Exception as e:
+            mark_redis_down(e)
+            return None
+        if raw is None:
+            return None
+
+        envelope = json.loads(raw)
+        remaining = envelope["expires_at"] - time.time()
+        if remaining <= 0:
+            return None
+        self.local.set(key, envelope["value"], remaining)
+        return envelope["value"]
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self.local.set(key, value, ttl)
+
+        redis = get_cache_redis()
+        if redis is None:
+            return
+        envelope = {"value": value, "expires_at": time.time() + ttl}
+        try:
+            await redis.set(self._redis_key(key), json.dumps(envelope, ensure_ascii=False), ex=max(1, int(ttl)))
+        except Exception as e:
+            mark_redis_down(e)
+
+    async def delete(self, key: str) -> None:
+        self.local.delete(key)
+
+        redis = get_cache_redis()
+        if redis is None:
+            return
+        try:
+            await redis.delete(self._redis_key(key))
+        except Exception as e:
+            mark_redis_down(e)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key within this process.
+    The first caller starts the work in its own task; later callers await the
+    same task. A cancelled caller does not cancel the shared work.
+    """
+
+    def __init__(self):
+        self._inflight: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+async def try_lock(name: str, ttl: float) -> Optional[str]:
+    """
+    Try to take a cross-worker lock in Redis.
+    Returns a token to pass to release_lock when the lock was taken, None when
+    another worker holds it, and "" when Redis is unavailable (no locking).
+    """
+    redis = get_cache_redis()
+    if redis is None:
+        return ""
+    token = uuid.uuid4().hex
+    try:
+        acquired = await redis.set(f"lock:{name}", token, nx=True, px=int(ttl * 1000))
+    except Exception as e:
+        mark_redis_down(e)
+        return ""
+    return token if acquired else None
+
+
+async def release_lock(name: str, token: str) -> None:
+    if not token:
+        return
+    redis = get_cache_redis()
+    if redis is None:
+        return
+    try:
+        await redis.eval(_RELEASE_LOCK_SCRIPT, 1, f"lock:{name}", token)
+    except Exception as e:
+        mark_redis_down(e)
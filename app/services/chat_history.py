@@ -0,0 +1,159 @@
+import json
+import logging
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from app.config import CHAT_CONTEXT_RING_SIZE, CHAT_CONTEXT_RING_TTL_SECONDS
+from app.database import chat_sessions_collection, chat_messages_collection
+from app.database.queries import HISTORY_TAIL_SORT, session_by_id, session_messages
+from app.services.cache import get_cache_redis, mark_redis_down
+from app.services.context_builder import estimate_tokens
+from app.services.session_stats import STATS_VERSION, preview_text, image_count
+
+logger = logging.getLogger(__name__)
+
+
+def _ring_key(session_id: str) -> str:
+    return f"chat:ctx:{session_id}"
+
+
+async def reserve_seq(session_id: str, docs: list[dict], now: datetime, title: str) -> int:
+    """
+    Atomically reserve sequence numbers for the message `docs` (in order) and
+    return the first one. The same write updates the session's counters and
+    last-message preview, and creates the session on its first message.
+    """
+    count = len(docs)
+    session = await chat_sessions_collection.find_one_and_update(
+        session_by_id(session_id),
+        {
+            "$inc": {
+                "message_seq": count,
+                "message_count": count,
+                "image_count": sum(image_count(doc) for doc in docs),
+            },
+            "$set": {
+                # Time of this write, not of the request (`now`), which was
+                # taken before the model answered.
+                "updated_at": datetime.utcnow(),
+                "last_message_preview": preview_text(docs[-1]["text"]),
+                "last_role": docs[-1]["role"],
+            },
+            "$setOnInsert": {
+                "title": title,
+                "created_at": now,
+                "is_deleted": False,
+                "stats_version": STATS_VERSION,
+            },
+        },
+        projection={"message_seq": 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    return session["message_seq"] - count + 1
+
+
+def _is_complete(entries: list[dict], message_seq: int, limit: int) -> bool:
+    """True when the cached window ends at the session's latest message and has no gaps."""
+    if not entries or entries[-1].get("seq") != message_seq:
+        return False
+    window = entries[-limit:]
+    if len(window) < limit and window[0].get("seq") != 1:
+        return False
+    return all(b.get("seq") == a.get("seq", 0) + 1 for a, b in zip(window, window[1:]))
+
+
+async def _read_ring(session_id: str) -> list[dict]:
+    redis = get_cache_redis()
+    if redis is None:
+        return []
+    try:
+        raw = await redis.lrange(_ring_key(session_id), 0, -1)
+    except Exception as e:
+        mark_redis_down(e)
+        return []
+    return [json.loads(item) for item in raw]
+
+
+async def _write_ring(session_id: str, entries: list[dict], create: bool) -> None:
+    redis = get_cache_redis()
+    if redis is None or not entries:
+        return
+    key = _ring_key(session_id)
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            if create:
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(entry, ensure_ascii=False) for entry in entries])
+            else:
+                # Only extend a ring that exists; a missing one is rebuilt on read.
+                pipe.rpushx(key, *[json.dumps(entry, ensure_ascii=False) for entry in entries])
+            pipe.ltrim(key, -CHAT_CONTEXT_RING_SIZE, -1)
+            pipe.expire(key, CHAT_CONTEXT_RING_TTL_SECONDS)
+            await pipe.execute()
+    except Exception as e:
+        mark_redis_down(e)
+
+
+def _entry(msg: dict) -> dict:
+    return {
+        "seq": msg.get("seq"),
+        "role": msg["role"],
+        "text": msg["text"],
+        "token_count": msg.get("token_count") or estimate_tokens(msg["text"]),
+    }
+
+
+async def _load_tail(session_id: str, limit: int) -> list[dict]:
+    cursor = chat_messages_collection.find(
+        session_messages(session_id), {"_id": 0, "seq": 1, "role": 1, "text": 1, "token_count": 1}
+    ).sort(HISTORY_TAIL_SORT).limit(limit)
+    entries = [_entry(msg) async for msg in cursor]
+    entries.reverse()
+    return entries
+
+
+async def load_recent_history(session_id: str, message_seq: int, limit: int) -> list[dict]:
+    """
+    Return the last `limit` messages of a session, oldest first.
+    The Redis ring is used when it provably holds that window; otherwise only
+    the tail is read from Mongo (newest first by seq) and the ring rebuilt.
+    """
+    if limit <= 0:
+        return []
+
+    entries = await _read_ring(session_id)
+    if _is_complete(entries, message_seq, limit):
+        return entries[-limit:]
+
+    fetch = max(limit, CHAT_CONTEXT_RING_SIZE)
+    entries = await _load_tail(session_id, fetch)
+    # Messages from before sequence numbers existed have no seq; a window that
+    # may reach them cannot be validated, so it is not cached.
+    sequenced = all(entry["seq"] is not None for entry in entries)
+    if entries and sequenced and not (entries[0]["seq"] == 1 and len(entries) == fetch):
+        await _write_ring(session_id, entries[-CHAT_CONTEXT_RING_SIZE:], create=True)
+    return entries[-limit:]
+
+
+async def append_messages(session_id: str, docs: list[dict], new_session: bool) -> None:
+    """
+    Insert messages (already carrying their seq) and extend the context ring.
+    Only a brand-new session starts a ring here, since its history is known
+    to be exactly these messages.
+    """
+    await chat_messages_collection.insert_many(docs)
+    entries = [_entry(doc) for doc in docs]
+    await _write_ring(session_id, entries, create=new_session and entries[0]["seq"] == 1)
+
+
+async def invalidate_history(session_id: str) -> None:
+    """Drop the cached ring after a message is edited or the session deleted."""
+    redis = get_cache_redis()
+    if redis is None:
+        return
+    try:
+        await redis.delete(_ring_key(session_id))
+    except Exception as e:
+        mark_redis_down(e)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+
+from app.config import (
+    CHAT_CONTEXT_TOKEN_BUDGET, CHAT_SUMMARY_MAX_WORDS, CHAT_COMPACTION_MIN_MESSAGES,
+    MAX_SUMMARY_MESSAGES, MAX_CONVERSATION_CHARS, GEMINI_TIMEOUT_SECONDS,
+)
+from app.database import chat_sessions_collection, chat_messages_collection
+from app.database.queries import SEQ_SORT, seq_range
+from app.services.cache import try_lock, release_lock
+from app.services.gemini_client import get_model, generate_content
+
+logger = logging.getLogger(__name__)
+
+# Fixed cost of a history entry (role and turn markers).
+MESSAGE_OVERHEAD_TOKENS = 4
+COMPACTION_LOCK_TTL_SECONDS = 120
+
+_background_tasks: set[asyncio.Task] = set()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate, about 4 UTF-8 bytes per token.
+    Arabic letters take two bytes, which matches their higher token rate.
+    """
+    return (len(text.encode("utf-8")) + 3) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def entry_tokens(entry: dict) -> int:
+    return entry.get("token_count") or estimate_tokens(entry.get("text", ""))
+
+
+def _truncate(entry: dict, tokens: int) -> dict:
+    """Copy of `entry` with its text cut to about `tokens`."""
+    if entry_tokens(entry) <= tokens:
+        return entry
+    max_bytes = max(tokens - MESSAGE_OVERHEAD_TOKENS - 1, 16) * 4
+    text = entry["text"].encode("utf-8")[:max_bytes].decode("utf-8", "ignore").rstrip() + "…"
+    return {**entry, "text": text, "token_count": estimate_tokens(text)}
+
+
+def _fit(entries: list[dict], budget: int) -> list[dict]:
+    """Shorten the longest entries until all of them fit in `budget` together."""
+    remaining = budget
+    allowance = {}
+    order = sorted(range(len(entries)), key=lambda i: entry_tokens(entries[i]))
+    for n, i in enumerate(order):
+        allowance[i] = min(entry_tokens(entries[i]), remaining // (len(entries) - n))
+        remaining -= allowance[i]
+    return [_truncate(entry, allowance[i]) for i, entry in enumerate(entries)]
+
+
+def build_context(
+    entries: list[dict],
+    summary: Optional[dict],
+    budget: int = CHAT_CONTEXT_TOKEN_BUDGET,
+) -> tuple[list[dict], Optional[int]]:
+    """
+    Assemble the Gemini chat history within a token budget.
+    The running summary (turns up to summary["upto_seq"]) goes first, then as
+    many of the newest entries as fit, oldest first and starting on a user
+    turn. The latest exchange is always included, truncated when it alone is
+    over budget. Returns (history, compact_upto): compact_upto is the seq the
+    summary should be advanced to when enough turns fell out of the window,
+    else None.
+    """
+    summary = summary or {}
+    summarized_upto = summary.get("upto_seq", 0)
+    summary_text = summary.get("text", "")
+
+    used = estimate_tokens(summary_text) if summary_text else 0
+    fresh = [
+        entry for entry in entries
+        if entry.get("seq") is None or entry["seq"] > summarized_upto
+    ]
+    last_user = next((i for i in range(len(fresh) - 1, -1, -1) if fresh[i]["role"] == "user"), None)
+
+    kept: list[dict] = []
+    if last_user is not None:
+        latest = fresh[last_user:]
+        if used + sum(entry_tokens(entry) for entry in latest) > budget:
+            kept = _fit(latest, budget - used)
+        else:
+            for entry in reversed(fresh):
+                cost = entry_tokens(entry)
+                if used + cost > budget:
+                    break
+                kept.append(entry)
+                used += cost
+            kept.reverse()
+            while kept[0]["role"] != "user":
+                kept.pop(0)
+
+    history = []
+    if summary_text:
+        history.append({"role": "user", "parts": [f"Summary of the earlier conversation:\n{summary_text}"]})
+        history.append({"role": "model", "parts": ["Understood."]})
+    for entry in kept:
+        role = "user" if entry["role"] == "user" else "model"
+        history.append({"role": role, "parts": [entry["text"]]})
+
+    # Everything unsummarized before the window (all of it when nothing was
+    # kept) is due for compaction.
+    compact_upto = None
+    boundary = kept[0].get("seq") if kept else (fresh[-1].get("seq") if fresh else None)
+    if boundary is not None:
+        dropped_upto = boundary - 1 if kept else boundary
+        if dropped_upto - summarized_upto >= CHAT_COMPACTION_MIN_MESSAGES:
+            compact_upto = dropped_upto
+    return history, compact_upto
+
+
+async def _compact(session_id: str, upto_seq: int, api_key: Optional[str], model_name: Optional[str]) -> None:
+    lock_name = f"ctx-summary:{session_id}"
+    token = await try_lock(lock_name, COMPACTION_LOCK_TTL_SECONDS)
+    if token is None:
+        return
+    try:
+        session = await chat_sessions_collection.find_one({"session_id": session_id}, {"context_summary": 1})
+        current = (session or {}).get("context_summary") or {}
+        since = current.get("upto_seq", 0)
+        if since >= upto_seq:
+            return
+
+        cursor = chat_messages_collection.find(
+            seq_range(session_id, since, upto_seq),
+            {"_id": 0, "role": 1, "text": 1},
+        ).sort(SEQ_SORT).limit(MAX_SUMMARY_MESSAGES)
+        messages = [msg async for msg in cursor]
+        messages.reverse()
+        if not messages:
+            return
+
+        conversation = "\n".join(
+            f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['text']}" for msg in messages
+        )[-MAX_CONVERSATION_CHARS:]
+        prompt = (
+            "Update the running summary of a conversation with the new turns below.\n"
+            f"Keep every fact, question and decision that later turns may refer to, in at most "
+            f"{CHAT_SUMMARY_MAX_WORDS} words, in the language of the conversation. "
+            "Return only the summary.\n\n"
+            f"Current summary:\n{current.get('text') or '(none)'}\n\n"
+            f"New turns:\n{conversation}"
+        )
+        response = await asyncio.wait_for(
+            generate_content(get_model(api_key, model_name), prompt),
+            timeout=GEMINI_TIMEOUT_SECONDS,
+        )
+        text = (response.text or "").strip()
+        if not text:
+            return
+
+        await chat_sessions_collection.update_one(
+            {
+                "session_id": session_id,
+                "$or": [
+                    {"context_summary.upto_seq": {"$lt": upto_seq}},
+                    {"context_summary": {"$exists": False}},
+                ],
+            },
+            {"$set": {"context_summary": {"text": text, "upto_seq": upto_seq, "updated_at": datetime.utcnow()}}},
+        )
+        logger.info("Compacted context of session %s up to seq %d", session_id, upto_seq)
+    except Exception as e:
+        logger.warning("Context compaction failed for session %s: %s", session_id, e)
+    finally:
+        if token:
+            await release_lock(lock_name, token)
+
+
+def schedule_compaction(session_id: str, upto_seq: int, api_key: Optional[str], model_name: Optional[str]) -> None:
+    """Fold turns up to `upto_seq` into the session summary in the background."""
+    task = asyncio.create_task(_compact(session_id, upto_seq, api_key, model_name))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
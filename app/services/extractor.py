@@ -0,0 +1,156 @@
+import re
+import logging
+from typing import Optional
+
+from bs4 import BeautifulSoup
+from lxml import html as lxml_html
+
+logger = logging.getLogger(__name__)
+
+NOISE_TAGS = {"script", "style", "nav", "footer", "header", "iframe", "noscript", "aside", "form", "button"}
+AD_CLASSES = {"ads", "advertisement", "menu", "navigation"}
+CANDIDATE_TAGS = {"div", "section", "article", "main"}
+
+# Same preference order as the CSS selectors in extract_with_soup.
+CONTENT_SELECTORS = [
+    lambda tag, classes, cls, el_id: tag == "article",
+    lambda tag, classes, cls, el_id: tag == "main",
+    lambda tag, classes, cls, el_id: "content" in classes,
+    lambda tag, classes, cls, el_id: "article-content" in classes,
+    lambda tag, classes, cls, el_id: "post-content" in classes,
+    lambda tag, classes, cls, el_id: "article-body" in classes,
+    lambda tag, classes, cls, el_id: "post-body" in classes,
+    lambda tag, classes, cls, el_id: el_id == "content",
+    lambda tag, classes, cls, el_id: "content" in cls,
+    lambda tag, classes, cls, el_id: "article" in el_id,
+]
+
+MIN_CONTENT_CHARS = 100
+# Each descendant tag costs this many characters when computing text density.
+TAG_WEIGHT = 50
+
+_parser = lxml_html.HTMLParser(encoding="utf-8", remove_comments=True, remove_pis=True)
+
+
+def _is_noise(tag: str, classes: set, cls: str, el_id: str) -> bool:
+    return tag in NOISE_TAGS or bool(classes & AD_CLASSES) or "ad-" in cls or "ad-" in el_id
+
+
+def extract_main_text(content: bytes) -> Optional[str]:
+    """
+    Extract the main article text in linear time.
+    Noise is removed in one walk over the tree, then a single bottom-up pass
+    computes text and link-text length per node. The result is the first
+    node matching the usual content selectors, or else the node with the best
+    text density. Returns None when nothing of at least MIN_CONTENT_CHARS is
+    found, so callers can fall back to the BeautifulSoup heuristic.
+    """
+    root = lxml_html.fromstring(content, parser=_parser)
+    if root is None:
+        return None
+
+    noisy = []
+    for el in root.iter():
+        if isinstance(el.tag, str):
+            cls = el.get("class") or ""
+            if _is_noise(el.tag, set(cls.split()), cls, el.get("id") or ""):
+                noisy.append(el)
+    for el in noisy:
+        if el.getparent() is not None:
+            el.drop_tree()
+
+    nodes = []
+    for el in root.iter():
+        if isinstance(el.tag, str):
+            cls = el.get("class") or ""
+            nodes.append((el, (el.tag, set(cls.split()), cls, el.get("id") or "")))
+
+    text_len: dict = {}
+    link_len: dict = {}
+    tag_count: dict = {}
+    for el, _ in reversed(nodes):
+        total = len((el.text or "").strip())
+        links = 0
+        tags = 0
+        for child in el:
+            if child not in text_len:
+                continue
+            total += text_len[child] + len((child.tail or "").strip())
+            links += link_len[child]
+            tags += tag_count[child] + 1
+        text_len[el] = total
+        link_len[el] = total if el.tag == "a" else links
+        tag_count[el] = tags
+
+    first_match: list = [None] * len(CONTENT_SELECTORS)
+    best, best_score = None, 0.0
+    for el, attrs in nodes:
+        for i, matches in enumerate(CONTENT_SELECTORS):
+            if first_match[i] is None and matches(*attrs):
+                first_match[i] = el
+        if el.tag in CANDIDATE_TAGS and text_len[el] >= MIN_CONTENT_CHARS:
+            own = text_len[el] - link_len[el]
+            score = own * own / (own + TAG_WEIGHT * tag_count[el] + 1)
+            if score > best_score:
+                best, best_score = el, score
+
+    main = next((el for el in first_match if el is not None and text_len[el] > MIN_CONTENT_CHARS), best)
+    if main is None:
+        return None
+
+    text = " ".join(piece.strip() for piece in main.itertext() if piece.strip())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def extract_with_soup(content: bytes) -> str:
+    """Slower BeautifulSoup heuristic, used when extract_main_text finds nothing."""
+    soup = BeautifulSoup(content, "html.parser", from_encoding="utf-8")
+
+    for tag in soup(["script", "style", "nav", "footer", "header", "iframe", "noscript", "aside", "form", "button"]):
+        tag.decompose()
+
+    for ad_class in [".ads", ".advertisement", ".menu", ".navigation", "[class*='ad-']", "[id*='ad-']"]:
+        for elem in soup.select(ad_class):
+            elem.decompose()
+
+    content_selectors = [
+        "article", "main", ".content", ".article-content",
+        ".post-content", ".article-body", ".post-body",
+        "#content", "[class*='content']", "[id*='article']",
+    ]
+
+    main_content = None
+    for selector in content_selectors:
+        main_content = soup.select_one(selector)
+        if main_content and len(main_content.get_text(strip=True)) > 100:
+            break
+
+    if not main_content or len(main_content.get_text(strip=True)) < 100:
+        all_divs = soup.find_all(["div", "section", "article"])
+        if all_divs:
+            main_content = max(all_divs, key=lambda x: len(x.get_text(strip=True)))
+
+    if not main_content:
+        main_content = soup.body if soup.body else soup
+
+    if main_content:
+        text = main_content.get_text(separator=" ", strip=True)
+    else:
+        text = soup.get_text(separator=" ", strip=True)
+
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def extract_page_content(content: bytes, url: str, max_chars: int) -> str:
+    try:
+        text = extract_main_text(content)
+    except Exception as e:
+        logger.warning("Fast extractor failed for %s: %s", url, e)
+        text = None
+    if not text:
+        text = extract_with_soup(content)
+
+    if len(text) < 50 or text.count("\ufffd") > 10:
+        logger.warning("Content from %s might be corrupted", url)
+
+    return text[:max_chars]
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Iterable, Optional
+
+import google.generativeai as genai
+from google.generativeai.client import _ClientManager
+
+from app.config import (
+    GEMINI_API_KEY, GEMINI_DEFAULT_MODEL,
+    GEMINI_MAX_CONCURRENCY, GEMINI_MODEL_CACHE_SIZE, GEMINI_MODEL_CACHE_TTL_SECONDS,
+)
+from app.services.cache import LRUCache
+from app.services.streaming import iterate_in_thread, iter_chunk_text
+
+logger = logging.getLogger(__name__)
+
+# The SDK calls block, so they run on a dedicated pool sized to the
+# concurrency cap; long streams never starve asyncio.to_thread users.
+_executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY, thread_name_prefix="gemini")
+_slots: Optional[asyncio.Semaphore] = None
+
+_clients = LRUCache(GEMINI_MODEL_CACHE_SIZE)
+_models = LRUCache(GEMINI_MODEL_CACHE_SIZE)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _get_client(api_key: str):
+    """
+    Generative service client bound to one API key.
+    Each key gets its own client manager instead of genai.configure(), which
+    swaps the SDK's global key and races between concurrent requests.
+    """
+    key = _digest(api_key)
+    client = _clients.get(key)
+    if client is None:
+        manager = _ClientManager()
+        manager.configure(api_key=api_key)
+        client = manager.make_client("generative")
+        _clients.set(key, client, GEMINI_MODEL_CACHE_TTL_SECONDS)
+    return client
+
+
+def get_model(
+    api_key: Optional[str] = None,
+    model_name: Optional[str] = None,
+    system_instruction: Optional[str] = None,
+) -> genai.GenerativeModel:
+    """Return a cached GenerativeModel for (api_key, model, system prompt)."""
+    api_key = api_key or GEMINI_API_KEY
+    model_name = model_name or GEMINI_DEFAULT_MODEL
+    key = f"{_digest(api_key)}:{model_name}:{_digest(system_instruction or '')}"
+
+    model = _models.get(key)
+    if model is None:
+        model = genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+        # The SDK binds a client lazily from global config; bind ours up front.
+        model._client = _get_client(api_key)
+        _models.set(key, model, GEMINI_MODEL_CACHE_TTL_SECONDS)
+    return model
+
+
+def _get_slots() -> asyncio.Semaphore:
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return _slots
+
+
+async def call(fn: Callable, *args, **kwargs):
+    """Run a blocking SDK call in the Gemini pool, within the concurrency cap."""
+    async with _get_slots():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def generate_content(model: genai.GenerativeModel, contents, **kwargs):
+    return await call(model.generate_content, contents, **kwargs)
+
+
+async def send_message(chat, content, **kwargs):
+    return await call(chat.send_message, content, **kwargs)
+
+
+async def stream_text(make_response: Callable[[], Iterable]) -> AsyncIterator[str]:
+    """
+    Yield text chunks of a streamed response, e.g.
+    stream_text(lambda: model.generate_content(prompt, stream=True)).
+    The concurrency slot is held until the stream ends or is abandoned.
+    """
+    async with _get_slots():
+        async for text in iterate_in_thread(lambda: iter_chunk_text(make_response()), executor=_executor):
+            yield text
+
+
+def shutdown_gemini_client() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
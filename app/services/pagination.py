@@ -0,0 +1,103 @@
+import json
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, Optional
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+
+def encode_cursor(values: list[Any]) -> str:
+    """Opaque, URL-safe cursor for a position in a keyset-ordered listing."""
+    raw = []
+    for value in values:
+        if isinstance(value, datetime):
+            raw.append({"d": value.isoformat()})
+        elif isinstance(value, ObjectId):
+            raw.append({"o": str(value)})
+        else:
+            raw.append(value)
+    data = json.dumps(raw, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> list[Any]:
+    """Inverse of encode_cursor; raises ValueError for malformed cursors."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(raw, list) or len(raw) != size:
+            raise ValueError("wrong cursor size")
+        values = []
+        for value in raw:
+            if isinstance(value, dict) and "d" in value:
+                values.append(datetime.fromisoformat(value["d"]))
+            elif isinstance(value, dict) and "o" in value:
+                values.append(ObjectId(value["o"]))
+            else:
+                values.append(value)
+        return values
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError, InvalidId, TypeError) as e:
+        raise ValueError(f"invalid cursor: {e}") from e
+
+
+def _beyond(keys: list[str], values: list[Any], op: str) -> dict:
+    """Filter for documents strictly past `values` in (keys...) order."""
+    clauses = []
+    for i, key in enumerate(keys):
+        clause = {k: v for k, v in zip(keys[:i], values[:i])}
+        clause[key] = {op: values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def keyset_sort(keys: list[str], direction: int = -1) -> list[tuple[str, int]]:
+    return [(key, direction) for key in keys]
+
+
+def page_filter(query: dict, keys: list[str], values: list[Any], towards_older: bool = True) -> dict:
+    """`query` restricted to documents past `values` in (keys...) order."""
+    return {"$and": [query, _beyond(keys, values, "$lt" if towards_older else "$gt")]}
+
+
+async def keyset_page(
+    collection,
+    query: dict,
+    projection: dict,
+    keys: list[str],
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> tuple[list[dict], Optional[str], Optional[str]]:
+    """
+    One page of documents ordered newest first on `keys` (which must end in a
+    unique field and be covered by an index).
+    `before` continues towards older documents, `after` towards newer ones.
+    Returns (docs newest first, older_cursor, newer_cursor); a cursor is None
+    when there is nothing more in that direction.
+    """
+    if before and after:
+        raise ValueError("before and after are mutually exclusive")
+
+    towards_older = after is None
+    position = before or after
+    if position:
+        values = decode_cursor(position, len(keys))
+        query = page_filter(query, keys, values, towards_older)
+
+    direction = -1 if towards_older else 1
+    cursor = collection.find(query, projection).sort(keyset_sort(keys, direction)).limit(limit + 1)
+    docs = await cursor.to_list(length=limit + 1)
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if not towards_older:
+        docs.reverse()
+    if not docs:
+        return [], None, None
+
+    def cursor_of(doc: dict) -> str:
+        return encode_cursor([doc[key] for key in keys])
+
+    older = cursor_of(docs[-1]) if (has_more or not towards_older) else None
+    newer = cursor_of(docs[0]) if (before or (after and has_more)) else None
+    return docs, older, newer
@@ -0,0 +1,129 @@
+import os
+import signal
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from app.config import (
+    PARSE_POOL_WORKERS, PARSE_TIMEOUT_SECONDS,
+    PARSE_POOL_MAX_TASKS, PARSE_POOL_MAX_RSS_MB, MAX_PAGE_CHARS,
+)
+from app.services.extractor import extract_page_content
+from app.services.parse_worker import parse_in_worker, report_pid
+
+logger = logging.getLogger(__name__)
+
+
+class ParsePool:
+    """
+    Bounded process pool for HTML extraction.
+    The pool is replaced after `max_tasks` parses or as soon as a worker
+    reports a peak RSS above `max_rss_mb`, so workers that leak memory on
+    pathological pages are recycled. A parse that exceeds `timeout` kills
+    the pool's processes, because a stuck worker cannot be interrupted;
+    workers report their pids at startup for this. Dead workers surface as
+    BrokenProcessPool, after which the pool is replaced and the parse retried
+    once.
+    """
+
+    def __init__(self, workers: int, timeout: float, max_tasks: int, max_rss_mb: int):
+        self.workers = workers
+        self.timeout = timeout
+        self.max_tasks = max_tasks
+        self.max_rss_mb = max_rss_mb
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid_queue = None
+        self._pids: set[int] = set()
+        self._tasks = 0
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: forking a process that runs asyncio and gRPC threads is unsafe.
+            context = multiprocessing.get_context("spawn")
+            # SimpleQueue writes synchronously, so a pid is readable as
+            # soon as the worker has started.
+            self._pid_queue = context.SimpleQueue()
+            self._pids = set()
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=report_pid,
+                initargs=(self._pid_queue,),
+            )
+            self._tasks = 0
+        return self._executor
+
+    def _kill_workers(self) -> None:
+        while not self._pid_queue.empty():
+            self._pids.add(self._pid_queue.get())
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def recycle(self, kill: bool = False) -> None:
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        if kill:
+            self._kill_workers()
+        # Already-submitted parses still finish on the old pool.
+        executor.shutdown(wait=False)
+        self._pid_queue.close()
+
+    async def parse(self, content: bytes, url: str = "") -> str:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers * 2)
+
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            for attempt in range(2):
+                executor = self._get_executor()
+                try:
+                    text, rss_mb = await asyncio.wait_for(
+                        loop.run_in_executor(executor, parse_in_worker, content, url, MAX_PAGE_CHARS),
+                        timeout=self.timeout,
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning("Parse of %s exceeded %ss, recycling parse pool", url, self.timeout)
+                    if executor is self._executor:
+                        self.recycle(kill=True)
+                    raise
+                except BrokenProcessPool:
+                    logger.warning("Parse pool broke while parsing %s, restarting it", url)
+                    if executor is self._executor:
+                        self.recycle()
+                    if attempt:
+                        raise
+                    continue
+
+                if executor is self._executor:
+                    self._tasks += 1
+                    if rss_mb > self.max_rss_mb or self._tasks >= self.max_tasks:
+                        logger.info("Recycling parse pool (tasks=%d, worker rss=%dMB)", self._tasks, rss_mb)
+                        self.recycle()
+                return text
+
+
+_parse_pool = ParsePool(
+    workers=PARSE_POOL_WORKERS,
+    timeout=PARSE_TIMEOUT_SECONDS,
+    max_tasks=PARSE_POOL_MAX_TASKS,
+    max_rss_mb=PARSE_POOL_MAX_RSS_MB,
+)
+
+
+async def parse_page(content: bytes, url: str = "") -> str:
+    """Extract page text off the event loop, in the process pool when enabled."""
+    if PARSE_POOL_WORKERS <= 0:
+        return await asyncio.to_thread(extract_page_content, content, url, MAX_PAGE_CHARS)
+    return await _parse_pool.parse(content, url)
+
+
+def shutdown_parse_pool() -> None:
+    _parse_pool.recycle()
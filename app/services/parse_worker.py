@@ -0,0 +1,20 @@
+"""
+Entry points run inside the parse pool's processes. Workers are spawned and
+re-import whatever module these functions live in, so this one imports only
+the extractor.
+"""
+import os
+import resource
+
+from app.services.extractor import extract_page_content
+
+
+def report_pid(pids) -> None:
+    """Pool initializer: tell the parent which process to kill if a parse hangs."""
+    pids.put(os.getpid())
+
+
+def parse_in_worker(content: bytes, url: str, max_chars: int) -> tuple[str, int]:
+    """Raw bytes in, text and peak RSS (MB) out."""
+    text = extract_page_content(content, url, max_chars)
+    return text, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024
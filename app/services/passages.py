@@ -0,0 +1,136 @@
+import re
+from collections import Counter
+
+import numpy as np
+
+from app.config import PASSAGE_CHARS, RAG_CONTEXT_CHAR_BUDGET
+from app.services.tokenizer import tokenize
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?؟؛\n])\s+")
+
+
+def split_passages(text: str, size: int = PASSAGE_CHARS) -> list[str]:
+    """Group whole sentences into passages of roughly `size` characters."""
+    passages = []
+    current = ""
+    for sentence in _SENTENCE_END_RE.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > size:
+            if current:
+                passages.append(current)
+                current = ""
+            cut = sentence.rfind(" ", 0, size)
+            cut = cut if cut > size // 2 else size
+            passages.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if not sentence:
+            continue
+        if current and len(current) + 1 + len(sentence) > size:
+            passages.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        passages.append(current)
+    return passages
+
+
+def score_passages(query: str, passages: list[str]) -> np.ndarray:
+    """BM25 score of every passage against the query, treating passages as the corpus."""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms or not passages:
+        return np.zeros(len(passages))
+
+    tf = np.zeros((len(passages), len(terms)))
+    lengths = np.zeros(len(passages))
+    term_index = {term: j for j, term in enumerate(terms)}
+    for i, passage in enumerate(passages):
+        tokens = tokenize(passage)
+        lengths[i] = len(tokens)
+        for term, count in Counter(tokens).items():
+            j = term_index.get(term)
+            if j is not None:
+                tf[i, j] = count
+
+    df = (tf > 0).sum(axis=0)
+    idf = np.log(1 + (len(passages) - df + 0.5) / (df + 0.5))
+    avg_length = max(lengths.mean(), 1.0)
+    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * lengths[:, None] / avg_length)
+    return (idf * tf * (BM25_K1 + 1) / norm).sum(axis=1)
+
+
+def rank_sources(query: str, sources: list[dict]) -> list[dict]:
+    """
+    Order sources by their best passage score (stable for ties).
+    All passages are scored together so scores are comparable across pages.
+    """
+    if len(sources) < 2:
+        return sources
+
+    owners = []
+    passages = []
+    for source_idx, source in enumerate(sources):
+        for passage in split_passages(source["content"]):
+            owners.append(source_idx)
+            passages.append(passage)
+
+    best = np.zeros(len(sources))
+    np.maximum.at(best, owners, score_passages(query, passages))
+    order = sorted(range(len(sources)), key=lambda i: -best[i])
+    return [sources[i] for i in order]
+
+
+def select_passages(query: str, sources: list[dict], budget: int = RAG_CONTEXT_CHAR_BUDGET) -> list[dict]:
+    """
+    Replace each source's content with its most query-relevant passages.
+    Every source keeps at least its best passage, so the source list (and the
+    [مصدر N] citation numbers built from it) is unchanged; the remaining budget
+    goes to the highest-scoring passages overall. Selected passages are kept
+    in page order within each source.
+    """
+    owners = []
+    positions = []
+    passages = []
+    for source_idx, source in enumerate(sources):
+        for position, passage in enumerate(split_passages(source["content"])):
+            owners.append(source_idx)
+            positions.append(position)
+            passages.append(passage)
+
+    if not passages:
+        return sources
+
+    scores = score_passages(query, passages)
+    # Stable sort keeps earlier passages first among equal scores.
+    ranked = np.argsort(-scores, kind="stable")
+
+    chosen: set[int] = set()
+    used = 0
+    best_per_source: dict[int, int] = {}
+    for idx in ranked:
+        best_per_source.setdefault(owners[idx], int(idx))
+    for idx in best_per_source.values():
+        chosen.add(idx)
+        used += len(passages[idx])
+
+    for idx in ranked:
+        idx = int(idx)
+        if idx in chosen:
+            continue
+        if used + len(passages[idx]) > budget:
+            continue
+        chosen.add(idx)
+        used += len(passages[idx])
+
+    selected: dict[int, list[tuple[int, str]]] = {}
+    for idx in chosen:
+        selected.setdefault(owners[idx], []).append((positions[idx], passages[idx]))
+
+    result = []
+    for source_idx, source in enumerate(sources):
+        parts = [text for _, text in sorted(selected.get(source_idx, []))]
+        result.append({**source, "content": " ... ".join(parts) if parts else source["content"][:PASSAGE_CHARS]})
+    return result
@@ -1,8 +1,26 @@
 import re
+import time
+import zlib
+import base64
+import asyncio
+import hashlib
 import logging
-import requests
-from bs4 import BeautifulSoup
-from app.config import SERPER_API_KEY, SERPER_API_URL
+from typing import Awaitable, Callable, Optional
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import httpx
+from app.config import (
+    SERPER_API_KEY, SERPER_API_URL,
+    SCRAPE_TIMEOUT_SECONDS, SCRAPE_DEADLINE_SECONDS,
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    HOST_MAX_CONNECTIONS, HOST_RATE_PER_SECOND, HOST_RATE_BURST, HOST_RATE_MAX_WAIT_SECONDS,
+    BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS,
+    SEARCH_CACHE_TTL_SECONDS, SEARCH_CACHE_NEGATIVE_TTL_SECONDS, SEARCH_CACHE_MAX_ENTRIES,
+    CONTENT_CACHE_FRESH_SECONDS, CONTENT_CACHE_MAX_AGE_SECONDS, CONTENT_CACHE_MAX_ENTRIES,
+)
+from app.services.cache import TwoTierCache
+from app.services.parse_pool import parse_page
 
 logger = logging.getLogger(__name__)
 
@@ -21,32 +39,408 @@ WEBSITES = {
     },
 }
 
+def resolve_websites(website) -> list[str]:
+    """Turn a RAGRequest.website value ("all", a key, or a list of keys) into known keys."""
+    if website == "all":
+        return list(WEBSITES)
+    requested = [website] if isinstance(website, str) else list(website)
+    if "all" in requested:
+        return list(WEBSITES)
+    sites = [site for site in dict.fromkeys(requested) if site in WEBSITES]
+    if not sites:
+        logger.warning("Unknown website: %s, falling back to altibbi", website)
+        return ["altibbi"]
+    return sites
 
-def clean_gemini_response(text: str) -> str:
-    if not text:
-        return "لم يتم توليد رد"
 
+SCRAPE_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "ar-SA,ar;q=0.9,en;q=0.8",
+    "Accept-Charset": "utf-8",
+}
+
+_http_client: Optional[httpx.AsyncClient] = None
+_search_cache = TwoTierCache("serper", max_entries=SEARCH_CACHE_MAX_ENTRIES)
+_content_cache = TwoTierCache("page", max_entries=CONTENT_CACHE_MAX_ENTRIES)
+_refreshing_urls: set[str] = set()
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Lazily create the shared outbound HTTP client.
+    Connections are pooled and kept alive across requests, so Serper and the
+    scraped sites are not re-dialled for every RAG query.
+    """
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            headers=SCRAPE_HEADERS,
+            timeout=httpx.Timeout(SCRAPE_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    for policy in _host_policies.values():
+        await policy.client.aclose()
+    _host_policies.clear()
+
+
+# ---------- Per-host outbound policy ----------
+
+class HostUnavailable(Exception):
+    """Raised instead of making a request when a host is rate limited or its breaker is open."""
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, max_wait: float) -> bool:
+        """
+        Reserve one token and sleep until it is due. The token is taken before
+        sleeping, so concurrent callers queue up behind each other instead of
+        all waking for the same token. False (nothing taken) if the wait would
+        exceed max_wait.
+        """
+        self._refill()
+        wait = max(0.0, (1 - self.tokens) / self.rate)
+        if wait > max_wait:
+            return False
+        self.tokens -= 1
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.tokens += 1
+                raise
+        return True
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures.
+    While open, calls fail fast until `reset_timeout` (or the host's
+    Retry-After) has passed; then one half-open probe decides whether the
+    breaker closes again or re-opens.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_until = 0.0
+        self.probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() < self.opened_until:
+                return False
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                return False
+            self.probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self.probe_in_flight = False
+
+    def record_failure(self, retry_after: Optional[float] = None) -> None:
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold or retry_after:
+            self.state = "open"
+            self.opened_until = time.monotonic() + max(retry_after or 0, self.reset_timeout)
+
+    def snapshot(self) -> dict:
+        retry_in = max(0.0, self.opened_until - time.monotonic()) if self.state == "open" else 0.0
+        return {"state": self.state, "failures": self.failures, "retry_in_seconds": round(retry_in, 1)}
+
+
+class HostPolicy:
+    def __init__(self, host: str):
+        self.host = host
+        self.client = httpx.AsyncClient(
+            headers=SCRAPE_HEADERS,
+            timeout=httpx.Timeout(SCRAPE_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=HOST_MAX_CONNECTIONS,
+                max_keepalive_connections=HOST_MAX_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+        self.bucket = TokenBucket(HOST_RATE_PER_SECOND, HOST_RATE_BURST)
+        self.breaker = CircuitBreaker(BREAKER_FAILURE_THRESHOLD, BREAKER_RESET_SECONDS)
+
+
+_host_policies: dict[str, HostPolicy] = {}
+
+
+def _host_key(url: str) -> str:
+    host = (urlsplit(url).hostname or "").lower()
+    return host[4:] if host.startswith("www.") else host
+
+
+def _retry_after_seconds(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def get_host_policy(url: str) -> HostPolicy:
+    host = _host_key(url)
+    policy = _host_policies.get(host)
+    if policy is None:
+        policy = _host_policies[host] = HostPolicy(host)
+    return policy
+
+
+async def fetch_url(url: str, headers: Optional[dict] = None) -> httpx.Response:
+    """
+    GET a page through its host's own connection pool, rate limit and breaker.
+    429 and 5xx responses and transport errors count as failures; the
+    response is returned as-is for the caller to check.
+    """
+    policy = get_host_policy(url)
+    # Check the breaker first so a rejected request does not use up a token.
+    if not policy.breaker.allow():
+        raise HostUnavailable(f"circuit open for {policy.host}")
+
+    try:
+        if not await policy.bucket.acquire(HOST_RATE_MAX_WAIT_SECONDS):
+            raise HostUnavailable(f"{policy.host} is rate limited")
+        response = await policy.client.get(url, headers=headers)
+    except httpx.TransportError:
+        policy.breaker.record_failure()
+        raise
+    except BaseException:
+        policy.breaker.probe_in_flight = False
+        raise
+
+    if response.status_code == 429 or response.status_code >= 500:
+        policy.breaker.record_failure(_retry_after_seconds(response))
+    else:
+        policy.breaker.record_success()
+    return response
+
+
+def get_host_states() -> list[dict]:
+    return [
+        {"host": host, **policy.breaker.snapshot(), "tokens": round(policy.bucket.tokens, 2)}
+        for host, policy in sorted(_host_policies.items())
+    ]
+
+
+def _strip_emphasis(text: str) -> str:
     text = re.sub(r'```[\w]*\n?.*?```', '', text, flags=re.DOTALL)
     text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
     text = re.sub(r'(?<!\w)\*(?!\*)(.+?)\*(?!\*)', r'\1', text)
+    return text
+
+
+def _clean_markdown(text: str) -> str:
+    text = _strip_emphasis(text)
     text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
     text = re.sub(r'^\s*[\*\-]\s+', '• ', text, flags=re.MULTILINE)
     text = re.sub(r'<[^>]+>', '', text)
     text = re.sub(r'\n{3,}', '\n\n', text)
     text = re.sub(r' +\n', '\n', text)
     text = re.sub(r' {2,}', ' ', text)
+    return text
+
 
-    return text.strip()
+def clean_gemini_response(text: str) -> str:
+    if not text:
+        return "لم يتم توليد رد"
 
+    return _clean_markdown(text).strip()
 
-def search_serper(query: str, website: str = "altibbi", num_links: int = 1) -> list[dict]:
-    site_config = WEBSITES.get(website)
-    if not site_config:
-        logger.warning("Unknown website: %s, falling back to altibbi", website)
-        site_config = WEBSITES["altibbi"]
 
-    domain = site_config["domain"]
+class IncrementalMarkdownCleaner:
+    """
+    Streaming counterpart of clean_gemini_response.
+    Text is cut only where no cleaning pattern can match across the cut, and
+    each segment is cleaned on its own, so the concatenation of feed() and
+    finish() outputs equals clean_gemini_response of the full text. Cuts are
+    never made inside a code fence or after a "<" whose ">" has not arrived
+    (tags may span lines, so such text is held until the tag closes or the
+    stream ends). Cuts are:
+    - at a line start, before a plain character;
+    - at a line start, before a bullet, heading or emphasis marker, when both
+      the previous line and the marker's own line have text the cleaning
+      keeps (otherwise the bullet and heading patterns, or the blank-line
+      collapse, could reach across the cut);
+    - inside a line, before a plain character that follows a space, once
+      every "*" since the last cut is part of a complete emphasis pair.
+    """
+
+    _UNSAFE_START = "*-#`<"
+    _MARKER_START = "*-#"
+    # Longest text re-checked for unpaired "*" when cutting inside a line.
+    _MAX_EMPHASIS_CHECK = 4096
+
+    def __init__(self):
+        self._pending: list[str] = []
+        self._pending_len = 0
+        self._received = False
+        self._started = False
+        self._held_space = ""
+        self._after_newline = False
+        self._after_space = False
+        self._in_fence = False
+        self._backticks = 0
+        self._open_tag = False
+        self._line_has_text = False
+        self._prev_line_has_text = False
+        # Position (in the pending text) of a marker line start that becomes
+        # a cut once its line shows text that survives cleaning.
+        self._marker_cut = -1
+
+    def feed(self, chunk: str) -> str:
+        """Add a chunk; return the cleaned text that is now final."""
+        if not chunk:
+            return ""
+        self._received = True
+
+        base = self._pending_len
+        line_cut = -1
+        inline_cut = -1
+        for i, ch in enumerate(chunk):
+            pos = base + i
+            if not self._in_fence and not self._open_tag and not ch.isspace():
+                if self._after_newline:
+                    self._marker_cut = -1
+                    if ch not in self._UNSAFE_START:
+                        line_cut = pos
+                    elif ch in self._MARKER_START and self._prev_line_has_text:
+                        self._marker_cut = pos
+                elif ch not in self._UNSAFE_START:
+                    if self._marker_cut >= 0:
+                        line_cut = self._marker_cut
+                        self._marker_cut = -1
+                    if self._after_space:
+                        inline_cut = pos
+
+            was_open = self._open_tag
+            self._after_newline = ch == "\n"
+            self._after_space = ch == " "
+            if ch == "`":
+                # Fences pair up like the regex: each run of three toggles.
+                self._backticks += 1
+                if self._backticks == 3:
+                    self._in_fence = not self._in_fence
+                    self._backticks = 0
+                continue
+            self._backticks = 0
+            if self._in_fence:
+                # Fenced text, newlines included, is removed before the
+                # line-based passes run.
+                continue
+            if ch == "\n":
+                # A tag may span lines, so an open "<" stays open here.
+                self._prev_line_has_text = self._line_has_text
+                self._line_has_text = False
+                self._marker_cut = -1
+            elif ch == "<":
+                self._open_tag = True
+            elif ch == ">":
+                self._open_tag = False
+            if not was_open and not ch.isspace() and ch not in self._UNSAFE_START:
+                # A character every pass keeps, so no pattern can reach
+                # across this line.
+                self._line_has_text = True
+
+        self._pending.append(chunk)
+        self._pending_len += len(chunk)
+        cut = line_cut
+        if inline_cut > line_cut and self._emphasis_closed(max(line_cut, 0), inline_cut):
+            cut = inline_cut
+        if cut == -1:
+            return ""
+
+        text = "".join(self._pending)
+        rest = text[cut:]
+        self._pending = [rest]
+        self._pending_len = len(rest)
+        if self._marker_cut >= 0:
+            self._marker_cut -= cut
+        return self._emit(_clean_markdown(text[:cut]))
+
+    def _emphasis_closed(self, start: int, end: int) -> bool:
+        """True when every "*" in pending[start:end] belongs to a matched pair."""
+        if end - start > self._MAX_EMPHASIS_CHECK:
+            return False
+        head = "".join(self._pending)[start:end]
+        return "*" not in head or "*" not in _strip_emphasis(head)
+
+    def finish(self) -> str:
+        """Flush the held-back tail; call once after the last chunk."""
+        if not self._received:
+            return "لم يتم توليد رد"
+        segment = "".join(self._pending)
+        self._pending = []
+        self._pending_len = 0
+        return self._emit(_clean_markdown(segment))
 
+    def _emit(self, text: str) -> str:
+        # Mirror the final strip(): drop leading whitespace, and hold trailing
+        # whitespace until more text follows it.
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        body = text.rstrip()
+        if not body:
+            self._held_space += text
+            return ""
+        out = self._held_space + body
+        self._held_space = text[len(body):]
+        return out
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split()).casefold()
+
+
+def _search_cache_key(website: str, query: str, num_links: int) -> str:
+    digest = hashlib.sha1(normalize_query(query).encode("utf-8")).hexdigest()
+    return f"{website}:{num_links}:{digest}"
+
+
+async def _fetch_serper(domain: str, query: str, num_links: int) -> Optional[list[dict]]:
+    """Query Serper directly. Returns None on failure so errors are never cached."""
     headers = {
         "X-API-KEY": SERPER_API_KEY,
         "Content-Type": "application/json",
@@ -55,7 +449,7 @@ def search_serper(query: str, website: str = "altibbi", num_links: int = 1) -> l
 
     try:
         logger.info("Searching via Serper: site:%s %s", domain, query)
-        response = requests.post(SERPER_API_URL, json=payload, headers=headers, timeout=10)
+        response = await get_http_client().post(SERPER_API_URL, json=payload, headers=headers, timeout=10)
         response.raise_for_status()
         data = response.json()
 
@@ -73,72 +467,154 @@ def search_serper(query: str, website: str = "altibbi", num_links: int = 1) -> l
 
         return results
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error("Serper API request error: %s", e)
-        return []
+        return None
     except Exception as e:
         logger.error("Serper API error: %s", e)
+        return None
+
+
+async def search_serper(query: str, website: str = "altibbi", num_links: int = 1) -> list[dict]:
+    if website not in WEBSITES:
+        logger.warning("Unknown website: %s, falling back to altibbi", website)
+        website = "altibbi"
+
+    cache_key = _search_cache_key(website, query, num_links)
+    cached = await _search_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Serper cache hit: %s %s", website, query)
+        return cached
+
+    results = await _fetch_serper(WEBSITES[website]["domain"], query, num_links)
+    if results is None:
         return []
 
+    ttl = SEARCH_CACHE_TTL_SECONDS if results else SEARCH_CACHE_NEGATIVE_TTL_SECONDS
+    await _search_cache.set(cache_key, results, ttl)
+    return results
 
-def scrape_page_content(url: str) -> str:
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-        "Accept-Language": "ar-SA,ar;q=0.9,en;q=0.8",
-        "Accept-Charset": "utf-8",
-    }
 
-    try:
-        logger.info("Scraping: %s", url)
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = "utf-8"
+def _pack_content(text: str) -> str:
+    return base64.b64encode(zlib.compress(text.encode("utf-8"))).decode("ascii")
 
-        soup = BeautifulSoup(response.content, "html.parser", from_encoding="utf-8")
 
-        for tag in soup(["script", "style", "nav", "footer", "header", "iframe", "noscript", "aside", "form", "button"]):
-            tag.decompose()
+def _unpack_content(packed: str) -> str:
+    return zlib.decompress(base64.b64decode(packed)).decode("utf-8")
 
-        for ad_class in [".ads", ".advertisement", ".menu", ".navigation", "[class*='ad-']", "[id*='ad-']"]:
-            for elem in soup.select(ad_class):
-                elem.decompose()
 
-        content_selectors = [
-            "article", "main", ".content", ".article-content",
-            ".post-content", ".article-body", ".post-body",
-            "#content", "[class*='content']", "[id*='article']",
-        ]
+def _content_cache_key(url: str) -> str:
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
 
-        main_content = None
-        for selector in content_selectors:
-            main_content = soup.select_one(selector)
-            if main_content and len(main_content.get_text(strip=True)) > 100:
-                break
 
-        if not main_content or len(main_content.get_text(strip=True)) < 100:
-            all_divs = soup.find_all(["div", "section", "article"])
-            if all_divs:
-                main_content = max(all_divs, key=lambda x: len(x.get_text(strip=True)))
+async def _fetch_page(url: str, cached: Optional[dict] = None) -> dict:
+    """
+    Download and extract a page, revalidating against a cached entry if given.
+    On 304 Not Modified the cached text is kept and the HTML is never parsed.
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = await fetch_url(url, headers=headers)
+    if cached and response.status_code == 304:
+        logger.info("Not modified: %s", url)
+        entry = {**cached, "fetched_at": time.time()}
+    else:
+        response.raise_for_status()
+        text = await parse_page(response.content, url)
+        entry = {
+            "content": _pack_content(text),
+            "etag": response.headers.get("etag"),
+            "last_modified": response.headers.get("last-modified"),
+            "fetched_at": time.time(),
+        }
+
+    if _unpack_content(entry["content"]):
+        await _content_cache.set(_content_cache_key(url), entry, CONTENT_CACHE_MAX_AGE_SECONDS)
+    return entry
+
+
+async def _refresh_page(url: str, cached: dict) -> None:
+    try:
+        await _fetch_page(url, cached)
+    except Exception as e:
+        logger.warning("Background refresh failed for %s: %s", url, e)
+    finally:
+        _refreshing_urls.discard(url)
 
-        if not main_content:
-            main_content = soup.body if soup.body else soup
 
-        if main_content:
-            text = main_content.get_text(separator=" ", strip=True)
-        else:
-            text = soup.get_text(separator=" ", strip=True)
+def _schedule_refresh(url: str, cached: dict) -> None:
+    if url in _refreshing_urls:
+        return
+    _refreshing_urls.add(url)
+    task = asyncio.create_task(_refresh_page(url, cached))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
 
-        text = re.sub(r"\s+", " ", text).strip()
 
-        if len(text) < 50 or text.count("\ufffd") > 10:
-            logger.warning("Content from %s might be corrupted", url)
+async def scrape_page_content(url: str) -> str:
+    cached = await _content_cache.get(_content_cache_key(url))
+    if cached is not None:
+        if time.time() - cached["fetched_at"] > CONTENT_CACHE_FRESH_SECONDS:
+            # Serve the stale copy now and revalidate in the background.
+            _schedule_refresh(url, cached)
+        return _unpack_content(cached["content"])
 
-        return text[:5000]
+    try:
+        logger.info("Scraping: %s", url)
+        entry = await _fetch_page(url)
+        return _unpack_content(entry["content"])
 
-    except requests.exceptions.RequestException as e:
+    except HostUnavailable as e:
+        logger.warning("Skipping %s: %s", url, e)
+        return ""
+    except httpx.HTTPError as e:
         logger.error("Request error for %s: %s", url, e)
         return ""
     except Exception as e:
         logger.error("Scraping error for %s: %s", url, e)
         return ""
+
+
+async def scrape_pages(
+    urls: list[str],
+    deadline: float = SCRAPE_DEADLINE_SECONDS,
+    on_page: Optional[Callable[[int, str], Awaitable[None]]] = None,
+) -> list[str]:
+    """
+    Scrape all URLs concurrently and return their contents in input order.
+    Pages that are not done when the deadline expires are cancelled and come
+    back as empty strings, so callers can continue with the partial results.
+    `on_page(index, content)` is awaited as each page finishes. Unfinished
+    pages are also cancelled when the caller is cancelled or on_page raises.
+    """
+    if not urls:
+        return []
+
+    tasks = [asyncio.create_task(scrape_page_content(url)) for url in urls]
+    positions = {task: i for i, task in enumerate(tasks)}
+    loop = asyncio.get_running_loop()
+    expires_at = loop.time() + deadline
+
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = expires_at - loop.time()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if on_page:
+                for task in sorted(done, key=positions.get):
+                    await on_page(positions[task], task.result())
+    finally:
+        # Also on cancellation (e.g. the SSE client left) or an on_page error.
+        for task in pending:
+            task.cancel()
+    if pending:
+        logger.warning("Scrape deadline of %ss hit, %d of %d pages dropped", deadline, len(pending), len(urls))
+
+    return [task.result() if task.done() and not task.cancelled() else "" for task in tasks]
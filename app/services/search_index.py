@@ -0,0 +1,274 @@
+import math
+import time
+import sqlite3
+import asyncio
+import argparse
+import logging
+import threading
+from collections import Counter
+from typing import Optional
+from urllib.parse import urljoin, urldefrag
+
+from bs4 import BeautifulSoup
+
+from app.config import SEARCH_INDEX_PATH
+from app.services.scraper import WEBSITES, fetch_url, close_http_client
+from app.services.parse_pool import parse_page, shutdown_parse_pool
+from app.services.tokenizer import tokenize
+
+logger = logging.getLogger(__name__)
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    site TEXT NOT NULL,
+    title TEXT NOT NULL DEFAULT '',
+    content TEXT NOT NULL,
+    length INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS documents_site ON documents (site);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+"""
+
+
+class SearchIndex:
+    """
+    On-disk inverted index (SQLite) with BM25 ranking.
+    Documents are keyed by URL; adding a URL again replaces its postings,
+    so the index can be updated incrementally from crawls or live scrapes.
+    Methods are blocking; call them through asyncio.to_thread from handlers.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def add_document(self, url: str, site: str, title: str, content: str) -> None:
+        terms = Counter(tokenize(f"{title} {content}"))
+        if not terms:
+            return
+
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()
+            if row:
+                doc_id = row[0]
+                self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                self._conn.execute(
+                    "UPDATE documents SET site = ?, title = ?, content = ?, length = ?, indexed_at = ? WHERE id = ?",
+                    (site, title, content, sum(terms.values()), time.time(), doc_id),
+                )
+            else:
+                cursor = self._conn.execute(
+                    "INSERT INTO documents (url, site, title, content, length, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (url, site, title, content, sum(terms.values()), time.time()),
+                )
+                doc_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                [(term, doc_id, tf) for term, tf in terms.items()],
+            )
+
+    def remove_document(self, url: str) -> None:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+                self._conn.execute("DELETE FROM documents WHERE id = ?", (row[0],))
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT site, COUNT(*) FROM documents GROUP BY site").fetchall()
+        return {site: count for site, count in rows}
+
+    def search(self, query: str, site: Optional[str] = None, limit: int = 10) -> list[dict]:
+        """
+        Return the top documents for the query, best first.
+        Each hit carries its BM25 score and the share of distinct query terms
+        it contains ("coverage"), which callers use to decide on a miss.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        # BM25 statistics are taken over the documents being searched, so a
+        # site filter ranks against that site's own term frequencies.
+        placeholders = ",".join("?" * len(terms))
+        scope = " WHERE site = ?" if site else ""
+        scope_params = [site] if site else []
+        with self._lock:
+            total_docs, avg_length = self._conn.execute(
+                f"SELECT COUNT(*), AVG(length) FROM documents{scope}", scope_params
+            ).fetchone()
+            if not total_docs:
+                return []
+
+            sql = (
+                "SELECT p.term, p.doc_id, p.tf, d.length FROM postings p "
+                f"JOIN documents d ON d.id = p.doc_id WHERE p.term IN ({placeholders})"
+            )
+            params = list(terms)
+            if site:
+                sql += " AND d.site = ?"
+                params.append(site)
+            rows = self._conn.execute(sql, params).fetchall()
+
+        # Every posting of the query terms in scope is in `rows`.
+        doc_freq = Counter(term for term, _, _, _ in rows)
+        scores: dict[int, float] = {}
+        matched: dict[int, int] = {}
+        for term, doc_id, tf, length in rows:
+            df = doc_freq.get(term, 0)
+            idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            matched[doc_id] = matched.get(doc_id, 0) + 1
+
+        top = sorted(scores, key=scores.get, reverse=True)[:limit]
+        if not top:
+            return []
+
+        with self._lock:
+            docs = {
+                row[0]: row[1:]
+                for row in self._conn.execute(
+                    f"SELECT id, url, site, title, content FROM documents WHERE id IN ({','.join('?' * len(top))})",
+                    top,
+                ).fetchall()
+            }
+
+        hits = []
+        for doc_id in top:
+            url, doc_site, title, content = docs[doc_id]
+            hits.append({
+                "url": url,
+                "site": doc_site,
+                "title": title,
+                "snippet": content[:200],
+                "content": content,
+                "score": scores[doc_id],
+                "coverage": matched[doc_id] / len(terms),
+            })
+        return hits
+
+
+_search_index: Optional[SearchIndex] = None
+
+
+def get_search_index() -> SearchIndex:
+    global _search_index
+    if _search_index is None:
+        SEARCH_INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+        _search_index = SearchIndex(str(SEARCH_INDEX_PATH))
+    return _search_index
+
+
+# ---------- Crawler ----------
+
+def _in_site(url: str, prefix: str) -> bool:
+    bare = url.split("://", 1)[-1]
+    if bare.startswith("www."):
+        bare = bare[4:]
+    return bare.startswith(prefix)
+
+
+async def crawl_site(website: str, seeds: list[str], max_pages: int = 200, concurrency: int = 4) -> int:
+    """
+    Breadth-first crawl of one configured website into the local index.
+    Only links under the site's domain prefix are followed. Returns the number
+    of pages indexed.
+    """
+    prefix = WEBSITES[website]["domain"]
+    index = get_search_index()
+    queue: asyncio.Queue = asyncio.Queue()
+    seen: set[str] = set()
+    indexed = 0
+
+    async def crawl_one(url: str) -> None:
+        nonlocal indexed
+        try:
+            response = await fetch_url(url)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning("Crawl fetch failed for %s: %s", url, e)
+            return
+
+        soup = BeautifulSoup(response.content, "html.parser", from_encoding="utf-8")
+        title = soup.title.get_text(strip=True) if soup.title else ""
+        for anchor in soup.find_all("a", href=True):
+            link = urldefrag(urljoin(str(response.url), anchor["href"]))[0]
+            if link not in seen and len(seen) < max_pages * 20 and _in_site(link, prefix):
+                seen.add(link)
+                queue.put_nowait(link)
+
+        try:
+            content = await parse_page(response.content, url)
+        except Exception as e:
+            logger.warning("Crawl parse failed for %s: %s", url, e)
+            return
+        if len(content) >= 100 and indexed < max_pages:
+            await asyncio.to_thread(index.add_document, url, website, title, content)
+            indexed += 1
+            logger.info("Indexed %s (%d/%d)", url, indexed, max_pages)
+
+    async def worker():
+        while True:
+            url = await queue.get()
+            try:
+                if indexed < max_pages:
+                    await crawl_one(url)
+            finally:
+                queue.task_done()
+
+    for seed in seeds:
+        seen.add(seed)
+        queue.put_nowait(seed)
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    await queue.join()
+    for task in workers:
+        task.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    return indexed
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Manage the local RAG search index")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    crawl = sub.add_parser("crawl", help="crawl a website into the index")
+    crawl.add_argument("website", choices=sorted(WEBSITES))
+    crawl.add_argument("--seed", action="append", required=True, help="start URL (repeatable)")
+    crawl.add_argument("--max-pages", type=int, default=200)
+
+    sub.add_parser("stats", help="show indexed document counts per site")
+
+    args = parser.parse_args()
+    if args.command == "crawl":
+        try:
+            count = await crawl_site(args.website, args.seed, args.max_pages)
+        finally:
+            await close_http_client()
+            shutdown_parse_pool()
+        print(f"Indexed {count} pages from {args.website}")
+    else:
+        for site, count in get_search_index().stats().items():
+            print(f"{site}: {count}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
@@ -0,0 +1,94 @@
+import asyncio
+import argparse
+import logging
+
+from app.database import chat_sessions_collection, chat_messages_collection
+from app.database.queries import NEWEST_MESSAGES_SORT, session_messages
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_CHARS = 120
+# Sessions with this stamp have counters maintained on write; older ones
+# need the backfill below.
+STATS_VERSION = 1
+
+
+def preview_text(text: str) -> str:
+    """Single-line snippet of a message for the session list."""
+    text = " ".join(text.split())
+    return text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS - 1].rstrip() + "…"
+
+
+def image_count(msg: dict) -> int:
+    return len(msg.get("images") or []) or (1 if msg.get("image_path") else 0)
+
+
+async def _compute_stats(session_id: str) -> dict:
+    count = 0
+    images = 0
+    cursor = chat_messages_collection.find(session_messages(session_id), {"images": 1, "image_path": 1})
+    async for msg in cursor:
+        count += 1
+        images += image_count(msg)
+
+    last = await chat_messages_collection.find_one(
+        session_messages(session_id),
+        {"role": 1, "text": 1},
+        sort=NEWEST_MESSAGES_SORT,
+    )
+    return {
+        "message_count": count,
+        "image_count": images,
+        "last_message_preview": preview_text(last.get("text", "")) if last else "",
+        "last_role": last["role"] if last else None,
+        "stats_version": STATS_VERSION,
+    }
+
+
+async def backfill_session_stats(limit: int = 0) -> int:
+    """
+    Compute the denormalized counters of sessions created before they were
+    maintained on write. A session that receives a message while it is being
+    computed (its message_seq moves) is recomputed. Returns the number updated.
+    """
+    updated = 0
+    cursor = chat_sessions_collection.find(
+        {"stats_version": {"$exists": False}},
+        {"_id": 0, "session_id": 1, "message_seq": 1},
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+    async for session in cursor:
+        session_id = session["session_id"]
+        seen_seq = session.get("message_seq")
+        for _ in range(3):
+            stats = await _compute_stats(session_id)
+            result = await chat_sessions_collection.update_one(
+                {"session_id": session_id, "message_seq": seen_seq, "stats_version": {"$exists": False}},
+                {"$set": stats},
+            )
+            if result.matched_count:
+                updated += 1
+                break
+            current = await chat_sessions_collection.find_one(
+                {"session_id": session_id}, {"message_seq": 1, "stats_version": 1}
+            )
+            if not current or "stats_version" in current:
+                break
+            seen_seq = current.get("message_seq")
+        else:
+            logger.warning("Gave up backfilling busy session %s", session_id)
+    return updated
+
+
+async def _main() -> None:
+    parser = argparse.ArgumentParser(description="Backfill denormalized chat session counters")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many sessions (0 = all)")
+    args = parser.parse_args()
+    count = await backfill_session_stats(args.limit)
+    print(f"Backfilled {count} sessions")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main())
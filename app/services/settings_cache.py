@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from typing import Optional
+
+from app.config import REDIS_RETRY_SECONDS
+from sqlalchemy import select
+
+from app.database import SettingsDB, AsyncSettingsSessionLocal
+from app.schemas import SettingsResponse
+from app.services.cache import get_cache_redis, mark_redis_down
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_CHANNEL = "settings:changed"
+SETTINGS_VERSION_KEY = "settings:version"
+
+_settings: Optional[SettingsResponse] = None
+_loaded = False
+_version = 0
+_load_lock: Optional[asyncio.Lock] = None
+
+
+async def _read_settings() -> Optional[SettingsResponse]:
+    async with AsyncSettingsSessionLocal() as db:
+        row = await db.scalar(select(SettingsDB).where(SettingsDB.id == 1))
+        return SettingsResponse.model_validate(row) if row else None
+
+
+async def load_settings(version: Optional[int] = None) -> None:
+    """(Re)load the settings row from MySQL into the process-wide cache."""
+    global _settings, _loaded, _version, _load_lock
+    if _load_lock is None:
+        _load_lock = asyncio.Lock()
+    async with _load_lock:
+        if version is not None:
+            _version = max(_version, version)
+        _settings = await _read_settings()
+        _loaded = True
+
+
+async def get_settings() -> Optional[SettingsResponse]:
+    """Cached settings (None when the row does not exist yet); no DB round trip once loaded."""
+    if not _loaded:
+        await load_settings()
+    return _settings
+
+
+async def settings_changed(settings: SettingsResponse) -> None:
+    """
+    Pick up freshly saved settings and tell the other workers.
+    The version is taken before the row is re-read from MySQL: when two
+    saves race, the worker holding the highest version has read the row
+    after both commits, and everyone else reloads on its notification, so
+    no worker keeps its own (possibly superseded) copy. Without Redis the
+    saved copy is used as-is.
+    """
+    global _settings, _loaded
+
+    redis = get_cache_redis()
+    if redis is not None:
+        try:
+            version = await redis.incr(SETTINGS_VERSION_KEY)
+        except Exception as e:
+            mark_redis_down(e)
+        else:
+            try:
+                await load_settings(version)
+            except Exception as e:
+                logger.warning("Settings reload after save failed: %s", e)
+                _settings, _loaded = settings, True
+            try:
+                await redis.publish(SETTINGS_CHANNEL, str(version))
+            except Exception as e:
+                mark_redis_down(e)
+            return
+
+    _settings = settings
+    _loaded = True
+
+
+async def _current_version(redis) -> int:
+    return int(await redis.get(SETTINGS_VERSION_KEY) or 0)
+
+
+async def _listen(redis) -> None:
+    pubsub = redis.pubsub()
+    try:
+        await pubsub.subscribe(SETTINGS_CHANNEL)
+        # Updates published while we were not subscribed.
+        version = await _current_version(redis)
+        if version > _version:
+            await load_settings(version)
+
+        async for message in pubsub.listen():
+            if message["type"] != "message":
+                continue
+            version = int(message["data"])
+            if version > _version:
+                logger.info("Settings changed (version %d), reloading", version)
+                await load_settings(version)
+    finally:
+        await pubsub.aclose()
+
+
+async def run_settings_listener() -> None:
+    """
+    Background loop that reloads the cache when another worker updates the
+    settings. While Redis is unavailable it reloads from MySQL every
+    REDIS_RETRY_SECONDS instead.
+    """
+    while True:
+        redis = get_cache_redis()
+        if redis is None:
+            await asyncio.sleep(REDIS_RETRY_SECONDS)
+            try:
+                await load_settings()
+            except Exception as e:
+                logger.warning("Settings reload failed: %s", e)
+            continue
+        try:
+            await _listen(redis)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            mark_redis_down(e)
@@ -0,0 +1,66 @@
+import json
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Callable, Iterable, Iterator, Optional
+
+from fastapi.encoders import jsonable_encoder
+
+_DONE = object()
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def iter_chunk_text(response: Iterable) -> Iterator[str]:
+    """Yield the text of each chunk of a streamed Gemini response."""
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. safety or finish metadata).
+            continue
+        if text:
+            yield text
+
+
+async def iterate_in_thread(make_iter: Callable[[], Iterable], executor: Optional[Executor] = None) -> AsyncIterator:
+    """
+    Consume a blocking iterator (e.g. a streamed Gemini response) in a worker
+    thread and yield its items on the event loop as they arrive.
+    If the consumer stops early the thread stops after its current item.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def put(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # The event loop is already closed; nobody is listening.
+            pass
+
+    def run():
+        try:
+            for item in make_iter():
+                if stop.is_set():
+                    break
+                put(item)
+        except BaseException as e:
+            put(_DONE, e)
+        else:
+            put(_DONE)
+
+    loop.run_in_executor(executor, run)
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                break
+            yield item
+    finally:
+        stop.set()
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.config import (
+    GEMINI_API_KEY, GEMINI_DEFAULT_MODEL,
+    MAX_SUMMARY_MESSAGES, MAX_CONVERSATION_CHARS, GEMINI_TIMEOUT_SECONDS,
+    SUMMARY_IDLE_MINUTES, SUMMARY_PRECOMPUTE_INTERVAL_SECONDS,
+    SUMMARY_PRECOMPUTE_BATCH, SUMMARY_PRECOMPUTE_LOOKBACK_HOURS,
+)
+from app.database import chat_sessions_collection, chat_messages_collection
+from app.database.queries import (
+    session_by_id, idle_sessions_to_summarize, messages_after_summary, IDLE_SESSIONS_SORT,
+)
+from app.services.cache import try_lock, release_lock
+from app.services.gemini_client import get_model, generate_content
+from app.services.settings_cache import get_settings
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_LOCK_TTL_SECONDS = GEMINI_TIMEOUT_SECONDS + 30
+
+
+def _format_messages(raw_messages: list[dict]) -> str:
+    lines = []
+    for msg in raw_messages:
+        label = "المستخدم" if msg["role"] == "user" else "المساعد"
+        text = msg.get("text", "")
+        has_images = bool(msg.get("images")) or bool(msg.get("image_path"))
+        if has_images:
+            text = f"{text} [تم إرفاق صورة]" if text else "[تم إرفاق صورة]"
+        lines.append(f"{label}: {text}")
+
+    conversation = "\n".join(lines)
+
+    if len(conversation) > MAX_CONVERSATION_CHARS:
+        conversation = conversation[:MAX_CONVERSATION_CHARS] + "\n... (تم اقتطاع بقية المحادثة)"
+    return conversation
+
+
+async def _messages_after(session_id: str, previous: Optional[dict]) -> list[dict]:
+    """Messages past the summary's watermark, oldest first (see messages_after_summary)."""
+    query, sort = messages_after_summary(session_id, previous)
+    raw_messages = []
+    cursor = chat_messages_collection.find(
+        query,
+        {"_id": 1, "role": 1, "text": 1, "images": 1, "image_path": 1, "created_at": 1, "seq": 1},
+    ).sort(sort).limit(MAX_SUMMARY_MESSAGES)
+    async for msg in cursor:
+        raw_messages.append(msg)
+
+    raw_messages.reverse()
+    return raw_messages
+
+
+def _build_prompt(conversation: str, lang_label: str, previous_text: Optional[str]) -> str:
+    if previous_text:
+        return (
+            f"لديك ملخص سابق لمحادثة ورسائل جديدة أضيفت بعده. "
+            f"حدّث الملخص ليشمل الرسائل الجديدة في فقرة واحدة واضحة ومركزة.\n\n"
+            f"ركز على:\n"
+            f"- المشكلة أو السؤال الأساسي\n"
+            f"- التحليل أو المناقشة التي تمت\n"
+            f"- النتيجة النهائية أو التوصيات\n\n"
+            f"اكتب بلغة {lang_label}.\n\n"
+            f"الملخص السابق:\n{previous_text}\n\n"
+            f"الرسائل الجديدة:\n{conversation}"
+        )
+    return (
+        f"لخّص المحادثة التالية في فقرة واحدة واضحة ومركزة.\n\n"
+        f"ركز على:\n"
+        f"- المشكلة أو السؤال الأساسي\n"
+        f"- التحليل أو المناقشة التي تمت\n"
+        f"- النتيجة النهائية أو التوصيات\n\n"
+        f"اكتب بلغة {lang_label}.\n\n"
+        f"المحادثة:\n{conversation}"
+    )
+
+
+async def update_session_summary(session: dict) -> Optional[dict]:
+    """
+    Fold messages newer than the stored summary into it and save the result.
+    Sessions without a (watermarked) summary are summarized from scratch.
+    Returns the new summary document, or None when there is nothing new.
+    Gemini errors and asyncio.TimeoutError propagate to the caller.
+    """
+    session_id = session["session_id"]
+    previous = session.get("summary")
+    if previous and previous.get("upto_id") is None and previous.get("upto_seq") is None:
+        # Summaries from before watermarks cannot be extended.
+        previous = None
+
+    raw_messages = await _messages_after(session_id, previous)
+    if not raw_messages:
+        return None
+
+    conversation = _format_messages(raw_messages)
+
+    settings = await get_settings()
+    api_key = (settings.api_key if settings and settings.api_key else None) or GEMINI_API_KEY
+    model_name = (settings.model if settings else None) or GEMINI_DEFAULT_MODEL
+    lang = settings.language if settings else "ar"
+    lang_label = "العربية" if lang == "ar" else lang
+
+    prompt = _build_prompt(conversation, lang_label, previous["text"] if previous else None)
+    model = get_model(api_key, model_name)
+    response = await asyncio.wait_for(
+        generate_content(model, prompt),
+        timeout=GEMINI_TIMEOUT_SECONDS,
+    )
+    summary_text = response.text if response.text else "لم يتم توليد ملخص."
+
+    last = raw_messages[-1]
+    summary_doc = {
+        "text": summary_text,
+        "model_name": model_name,
+        "generated_at": datetime.utcnow(),
+        "message_count": (previous.get("message_count", 0) if previous else 0) + len(raw_messages),
+        "chars_sent": len(conversation),
+        "upto_created_at": last["created_at"],
+        "upto_id": last["_id"],
+        "upto_seq": last.get("seq"),
+    }
+
+    await chat_sessions_collection.update_one(
+        {"session_id": session_id},
+        {"$set": {"summary": summary_doc}},
+    )
+    return summary_doc
+
+
+def _has_unsummarized(session: dict) -> bool:
+    """
+    True when the session has messages past its summary. Compared on seq
+    rather than timestamps: updated_at is stamped when an exchange is saved,
+    which can be after a summary that was generated without it.
+    """
+    summary = session.get("summary") or {}
+    upto_seq = summary.get("upto_seq")
+    message_seq = session.get("message_seq")
+    if not summary:
+        return True
+    if message_seq is None:
+        return False
+    return upto_seq is None or upto_seq < message_seq
+
+
+async def _precompute_once() -> None:
+    now = datetime.utcnow()
+    cursor = chat_sessions_collection.find(
+        idle_sessions_to_summarize(
+            idle_before=now - timedelta(minutes=SUMMARY_IDLE_MINUTES),
+            active_after=now - timedelta(hours=SUMMARY_PRECOMPUTE_LOOKBACK_HOURS),
+        ),
+        {"_id": 0, "session_id": 1},
+    ).sort(IDLE_SESSIONS_SORT).limit(SUMMARY_PRECOMPUTE_BATCH)
+    session_ids = [doc["session_id"] async for doc in cursor]
+
+    for session_id in session_ids:
+        lock_name = f"summary:{session_id}"
+        token = await try_lock(lock_name, SUMMARY_LOCK_TTL_SECONDS)
+        if token is None:
+            continue
+        try:
+            # Re-read under the lock: another worker may have just finished it.
+            session = await chat_sessions_collection.find_one(
+                session_by_id(session_id),
+                {"_id": 0, "session_id": 1, "summary": 1, "message_seq": 1},
+            )
+            if not session or not _has_unsummarized(session):
+                continue
+            if await update_session_summary(session) is not None:
+                logger.info("Precomputed summary for idle session %s", session_id)
+        except Exception as e:
+            logger.warning("Summary precompute failed for session %s: %s", session_id, e)
+        finally:
+            await release_lock(lock_name, token)
+
+
+async def run_summary_precompute() -> None:
+    """Background loop that keeps summaries of idle sessions up to date."""
+    while True:
+        await asyncio.sleep(SUMMARY_PRECOMPUTE_INTERVAL_SECONDS)
+        try:
+            await _precompute_once()
+        except Exception as e:
+            logger.warning("Summary precompute sweep failed: %s", e)
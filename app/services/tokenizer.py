@@ -0,0 +1,58 @@
+import re
+
+_DIACRITICS_RE = re.compile(r"[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]")
+_TOKEN_RE = re.compile(r"\w+")
+
+_LETTER_MAP = str.maketrans({
+    "أ": "ا",
+    "إ": "ا",
+    "آ": "ا",
+    "ٱ": "ا",
+    "ى": "ي",
+    "ئ": "ي",
+    "ؤ": "و",
+    "ة": "ه",
+})
+
+_PREFIXES = ("وال", "بال", "كال", "فال", "لل", "ال")
+_SUFFIXES = ("ات", "ون", "ين", "ان", "ها")
+
+STOPWORDS = {
+    "في", "من", "علي", "الي", "عن", "مع", "هذا", "هذه", "ذلك", "تلك", "التي", "الذي",
+    "الذين", "هو", "هي", "هم", "ان", "او", "ام", "ما", "ماذا", "لماذا", "كيف", "هل",
+    "متي", "اين", "كل", "بعض", "قد", "لا", "لم", "لن", "ثم", "اذا", "كان", "كانت",
+    "يكون", "تكون", "عند", "بين", "حتي", "بعد", "قبل", "به", "بها", "له", "لها",
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "for", "is", "are", "what",
+    "how", "why", "with", "by", "at", "be", "it", "this", "that",
+}
+
+
+def normalize_arabic(text: str) -> str:
+    text = _DIACRITICS_RE.sub("", text)
+    return text.translate(_LETTER_MAP).casefold()
+
+
+def _stem(token: str) -> str:
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            token = token[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            break
+    return token
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split text into normalized search terms.
+    Arabic letter variants and diacritics are folded, stopwords dropped and
+    common clitic prefixes / plural suffixes stripped (light stemming).
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(normalize_arabic(text)):
+        if len(token) < 2 or token in STOPWORDS:
+            continue
+        tokens.append(_stem(token))
+    return tokens
@@ -0,0 +1,177 @@
+import os
+import re
+import shutil
+import asyncio
+import logging
+import tempfile
+from typing import Optional
+
+from app.config import (
+    TRANSCRIBE_SEGMENT_SECONDS, TRANSCRIBE_OVERLAP_SECONDS, TRANSCRIBE_MAX_PARALLEL,
+    TRANSCRIPT_CACHE_TTL_SECONDS, TRANSCRIPT_CACHE_MAX_ENTRIES,
+)
+from app.services.cache import TwoTierCache, SingleFlight
+from app.services.gemini_client import get_model, generate_content
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIBE_PROMPT = (
+    "Transcribe this audio exactly as spoken. Return ONLY the transcript text, "
+    "nothing else. No labels, no quotes, no explanations."
+)
+SEGMENT_MIME = "audio/flac"
+# Longest run of words the overlap between two segments can produce.
+MAX_OVERLAP_WORDS = 60
+
+_transcript_cache = TwoTierCache("transcript", max_entries=TRANSCRIPT_CACHE_MAX_ENTRIES)
+_transcript_flights = SingleFlight()
+
+_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _normalize(word: str) -> str:
+    return _WORD_RE.sub("", word).lower()
+
+
+def stitch_transcripts(parts: list[str]) -> str:
+    """
+    Join segment transcripts, dropping the words repeated because segments
+    overlap: the longest suffix of the text so far that matches a prefix of
+    the next segment (ignoring case and punctuation) is kept only once.
+    """
+    words: list[str] = []
+    for part in parts:
+        new_words = part.split()
+        if not new_words:
+            continue
+        tail = [_normalize(w) for w in words[-MAX_OVERLAP_WORDS:]]
+        head = [_normalize(w) for w in new_words[:MAX_OVERLAP_WORDS]]
+        overlap = 0
+        for size in range(min(len(tail), len(head)), 0, -1):
+            if tail[-size:] == head[:size]:
+                overlap = size
+                break
+        words.extend(new_words[overlap:])
+    return " ".join(words)
+
+
+def _segment_starts(duration: float) -> list[float]:
+    step = TRANSCRIBE_SEGMENT_SECONDS - TRANSCRIBE_OVERLAP_SECONDS
+    starts = [0.0]
+    while starts[-1] + TRANSCRIBE_SEGMENT_SECONDS < duration:
+        starts.append(starts[-1] + step)
+    return starts
+
+
+async def _run(*args: str) -> bytes:
+    process = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        stdout, stderr = await process.communicate()
+    except asyncio.CancelledError:
+        process.kill()
+        raise
+    if process.returncode != 0:
+        raise RuntimeError(f"{args[0]} failed: {stderr.decode(errors='replace')[-300:]}")
+    return stdout
+
+
+async def _probe_duration(path: str) -> Optional[float]:
+    """
+    Audio length in seconds. Browser (MediaRecorder) webm/ogg files carry no
+    container duration, so when ffprobe reports none the packets are read and
+    the last timestamp is used instead.
+    """
+    try:
+        output = await _run(
+            "ffprobe", "-v", "error", "-show_entries", "format=duration",
+            "-of", "default=noprint_wrappers=1:nokey=1", path,
+        )
+        try:
+            return float(output.strip())
+        except ValueError:
+            pass
+        output = await _run(
+            "ffprobe", "-v", "error", "-select_streams", "a:0", "-show_entries", "packet=pts_time",
+            "-of", "csv=p=0", path,
+        )
+        times = [t for t in (line.strip(",") for line in output.decode().split()) if t and t != "N/A"]
+        return float(times[-1]) if times else None
+    except (RuntimeError, ValueError) as e:
+        logger.warning("Could not read audio duration: %s", e)
+        return None
+
+
+async def _cut_segment(path: str, start: float) -> bytes:
+    return await _run(
+        "ffmpeg", "-v", "error", "-ss", f"{start:.3f}", "-t", str(TRANSCRIBE_SEGMENT_SECONDS),
+        "-i", path, "-vn", "-ac", "1", "-ar", "16000", "-f", "flac", "pipe:1",
+    )
+
+
+async def _transcribe_once(model, data: bytes, mime: str) -> str:
+    response = await generate_content(model, [TRANSCRIBE_PROMPT, {"mime_type": mime, "data": data}])
+    return response.text.strip() if response.text else ""
+
+
+def _write_temp(data: bytes) -> str:
+    fd, path = tempfile.mkstemp(prefix="audio-")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    return path
+
+
+async def _transcribe_segments(model, audio_bytes: bytes, mime: str) -> str:
+    """
+    Transcribe long audio as overlapping segments in parallel.
+    Without ffmpeg/ffprobe, or for short clips, the audio is sent in one piece.
+    """
+    if not (shutil.which("ffmpeg") and shutil.which("ffprobe")):
+        return await _transcribe_once(model, audio_bytes, mime)
+
+    path = await asyncio.to_thread(_write_temp, audio_bytes)
+    try:
+        duration = await _probe_duration(path)
+        if duration is None or duration <= TRANSCRIBE_SEGMENT_SECONDS + TRANSCRIBE_OVERLAP_SECONDS:
+            return await _transcribe_once(model, audio_bytes, mime)
+
+        starts = _segment_starts(duration)
+        slots = asyncio.Semaphore(TRANSCRIBE_MAX_PARALLEL)
+
+        async def transcribe_segment(start: float) -> str:
+            async with slots:
+                segment = await _cut_segment(path, start)
+                return await _transcribe_once(model, segment, SEGMENT_MIME)
+
+        logger.info("Transcribing %.0fs of audio in %d segments", duration, len(starts))
+        parts = await asyncio.gather(*(transcribe_segment(start) for start in starts))
+        return stitch_transcripts(parts)
+    finally:
+        await asyncio.to_thread(os.unlink, path)
+
+
+async def transcribe_audio(
+    audio_bytes: bytes,
+    digest: str,
+    mime: str,
+    api_key: str,
+    model_name: str,
+) -> str:
+    """
+    Transcript of the audio, cached by content hash (and model).
+    Concurrent requests for the same audio share one transcription.
+    """
+    key = f"{model_name}:{digest}"
+    cached = await _transcript_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def run() -> str:
+        model = get_model(api_key, model_name)
+        transcript = await _transcribe_segments(model, audio_bytes, mime)
+        if transcript:
+            await _transcript_cache.set(key, transcript, TRANSCRIPT_CACHE_TTL_SECONDS)
+        return transcript
+
+    return await _transcript_flights.do(key, run)
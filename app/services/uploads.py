@@ -0,0 +1,151 @@
+import io
+import os
+import asyncio
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from fastapi import UploadFile
+from fastapi.staticfiles import StaticFiles
+from PIL import Image, ImageOps
+
+from app.config import (
+    UPLOAD_DIR, IMAGE_EXTENSIONS, UPLOAD_CHUNK_BYTES,
+    IMAGE_THUMBNAIL_PX, IMAGE_PREVIEW_PX, IMAGE_WORKERS, UPLOAD_CACHE_CONTROL,
+)
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES = {"thumbnail": IMAGE_THUMBNAIL_PX, "preview": IMAGE_PREVIEW_PX}
+
+_image_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="images")
+_derivative_tasks: set[asyncio.Future] = set()
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _write_atomic(target, write) -> None:
+    target.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=target.parent, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            write(tmp)
+        os.replace(tmp_path, target)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _store(relative_path: str, data: bytes) -> bool:
+    """
+    Write `data` to UPLOAD_DIR/relative_path unless it is already there.
+    Writes go to a temp file in the same directory and are renamed into
+    place, so readers never see a partial file. Returns True if written.
+    """
+    target = UPLOAD_DIR / relative_path
+    if target.exists():
+        return False
+    _write_atomic(target, lambda tmp: tmp.write(data))
+    return True
+
+
+def derivative_path(relative_path: str, kind: str) -> str:
+    stem = relative_path.rsplit(".", 1)[0]
+    return f"{stem}.{kind}.webp"
+
+
+def _make_derivatives(relative_path: str, data: bytes) -> None:
+    """Write the missing WebP thumbnail/preview of an image (runs in the image pool)."""
+    pending = {
+        kind: size for kind, size in DERIVATIVES.items()
+        if not (UPLOAD_DIR / derivative_path(relative_path, kind)).exists()
+    }
+    if not pending:
+        return
+
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+        for kind, size in sorted(pending.items(), key=lambda item: -item[1]):
+            image.thumbnail((size, size))
+            _write_atomic(
+                UPLOAD_DIR / derivative_path(relative_path, kind),
+                lambda tmp: image.save(tmp, "WEBP", quality=80, method=4),
+            )
+
+
+def schedule_derivatives(relative_path: str, data: bytes) -> None:
+    """Generate derivatives off the request path; failures are only logged."""
+    future = asyncio.get_running_loop().run_in_executor(_image_executor, _make_derivatives, relative_path, data)
+    _derivative_tasks.add(future)
+
+    def done(fut: asyncio.Future) -> None:
+        _derivative_tasks.discard(fut)
+        if not fut.cancelled() and fut.exception():
+            logger.warning("Derivative generation failed for %s: %s", relative_path, fut.exception())
+
+    future.add_done_callback(done)
+
+
+def shutdown_image_pool() -> None:
+    _image_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """
+    StaticFiles for content-addressed uploads: file names never change
+    content, so responses may be cached forever. ETag, Last-Modified and
+    Range requests are handled by Starlette's FileResponse.
+    """
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = UPLOAD_CACHE_CONTROL
+        return response
+
+
+async def save_image_upload(upload: UploadFile, max_bytes: int, uploaded_at: datetime) -> tuple[dict, bytes]:
+    """
+    Read an uploaded image in chunks, hashing as it arrives and rejecting it
+    with UploadTooLarge as soon as it exceeds `max_bytes`. The file is stored
+    once under its SHA-256 (uploads/ab/abcd....ext), so identical uploads
+    share one file, and its derivatives are generated in the background.
+    Returns the image metadata and the bytes, which callers pass on to
+    Gemini instead of reading the file back.
+    """
+    hasher = hashlib.sha256()
+    chunks = []
+    size = 0
+    while True:
+        chunk = await upload.read(UPLOAD_CHUNK_BYTES)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(upload.filename)
+        hasher.update(chunk)
+        chunks.append(chunk)
+
+    data = b"".join(chunks)
+    digest = hasher.hexdigest()
+    filename = f"{digest}{IMAGE_EXTENSIONS.get(upload.content_type, '.jpg')}"
+    relative_path = f"{digest[:2]}/{filename}"
+
+    if not await asyncio.to_thread(_store, relative_path, data):
+        logger.info("Upload %s deduplicated to %s", upload.filename, relative_path)
+    schedule_derivatives(relative_path, data)
+
+    info = {
+        "path": f"/uploads/{relative_path}",
+        "filename": filename,
+        "content_type": upload.content_type,
+        "size": size,
+        "uploaded_at": uploaded_at,
+        "thumbnail_path": f"/uploads/{derivative_path(relative_path, 'thumbnail')}",
+        "preview_path": f"/uploads/{derivative_path(relative_path, 'preview')}",
+    }
+    return info, data
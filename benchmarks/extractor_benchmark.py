@@ -0,0 +1,91 @@
+"""
+Compare the lxml text-density extractor with the BeautifulSoup heuristic.
+
+Pages are read from benchmarks/pages/<site>_*.html. Save real pages first:
+
+    python -m benchmarks.extractor_benchmark --save altibbi https://altibbi.com/...
+    python -m benchmarks.extractor_benchmark
+
+--synthetic adds generated deeply nested pages, which show the quadratic
+cost of the old max(get_text) fallback.
+"""
+import sys
+import time
+import argparse
+import asyncio
+from pathlib import Path
+from urllib.parse import urlparse
+
+from app.services.extractor import extract_main_text, extract_with_soup
+from app.services.scraper import WEBSITES, get_http_client, close_http_client
+
+PAGES_DIR = Path(__file__).resolve().parent / "pages"
+
+
+def _synthetic_page(depth: int) -> bytes:
+    body = "<p>فقرة طبية عن أعراض المرض وطرق العلاج المتاحة.</p>" * 5
+    for i in range(depth):
+        body = f"<div class='wrap-{i}'><span>عنصر {i}</span>{body}</div>"
+    return f"<html><body>{body}</body></html>".encode("utf-8")
+
+
+def _time(fn, content: bytes, repeat: int) -> tuple[float, str]:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        text = fn(content) or ""
+    return (time.perf_counter() - start) / repeat * 1000, text
+
+
+def _overlap(a: str, b: str) -> float:
+    wa, wb = set(a.split()), set(b.split())
+    return len(wa & wb) / max(len(wa | wb), 1)
+
+
+async def _save(site: str, urls: list[str]) -> None:
+    PAGES_DIR.mkdir(exist_ok=True)
+    try:
+        for url in urls:
+            response = await get_http_client().get(url)
+            response.raise_for_status()
+            name = urlparse(url).path.strip("/").replace("/", "_")[-60:] or "index"
+            path = PAGES_DIR / f"{site}_{name}.html"
+            path.write_bytes(response.content)
+            print(f"saved {path}")
+    finally:
+        await close_http_client()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", nargs="+", metavar=("SITE", "URL"), help="download pages for a site")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--synthetic", action="store_true", help="include generated nested pages")
+    args = parser.parse_args()
+
+    if args.save:
+        site, urls = args.save[0], args.save[1:]
+        if site not in WEBSITES or not urls:
+            parser.error(f"--save needs one of {sorted(WEBSITES)} and at least one URL")
+        asyncio.run(_save(site, urls))
+        return 0
+
+    pages = [(path.name, path.read_bytes()) for path in sorted(PAGES_DIR.glob("*.html"))]
+    if args.synthetic:
+        pages += [(f"synthetic_depth_{d}", _synthetic_page(d)) for d in (50, 200, 400)]
+    if not pages:
+        print(f"No pages in {PAGES_DIR}; use --save or --synthetic", file=sys.stderr)
+        return 1
+
+    print(f"{'page':<48} {'soup ms':>9} {'lxml ms':>9} {'speedup':>8} {'soup chars':>11} {'lxml chars':>11} {'overlap':>8}")
+    for name, content in pages:
+        soup_ms, soup_text = _time(extract_with_soup, content, args.repeat)
+        fast_ms, fast_text = _time(extract_main_text, content, args.repeat)
+        print(
+            f"{name[:48]:<48} {soup_ms:>9.1f} {fast_ms:>9.1f} {soup_ms / max(fast_ms, 1e-6):>7.1f}x "
+            f"{len(soup_text):>11} {len(fast_text):>11} {_overlap(soup_text, fast_text):>8.2f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
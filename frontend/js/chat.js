@@ -41,6 +41,13 @@ var currentSessionId = null;
 var chatHistory = [];
 var pendingFiles = [];
 
+// Keyset pagination cursors (null when there is nothing older to load)
+var sessionsOlderCursor = null;
+var messagesOlderCursor = null;
+var loadingOlderSessions = false;
+var loadingOlderMessages = false;
+var SCROLL_LOAD_MARGIN = 80;
+
 var LANG_LABELS = { ar: 'AR', en: 'EN', fr: 'FR', es: 'ES', tr: 'TR', de: 'DE' };
 
 /* ===== Sidebar toggle ===== */
@@ -296,8 +303,11 @@ if (recordBtn) {
 }
 
 /* ===== Lightbox ===== */
-function openLightbox(src) {
-    if (lightboxImg) lightboxImg.src = src;
+function openLightbox(src, fallback) {
+    if (lightboxImg) {
+        lightboxImg.onerror = fallback ? function() { lightboxImg.onerror = null; lightboxImg.src = fallback; } : null;
+        lightboxImg.src = src;
+    }
     if (imageLightbox) imageLightbox.classList.add('open');
 }
 
@@ -329,22 +339,53 @@ function loadSessions() {
             if (!res.ok) throw new Error('fail');
             return res.json();
         })
-        .then(function(sessions) {
-            renderSessionList(sessions);
+        .then(function(page) {
+            sessionsOlderCursor = page.older_cursor;
+            renderSessionList(page.sessions, false);
         })
         .catch(function(e) {
             console.warn('Failed to load sessions', e);
         });
 }
 
-function renderSessionList(sessions) {
+function loadOlderSessions() {
+    if (!sessionsOlderCursor || loadingOlderSessions) return;
+    loadingOlderSessions = true;
+    fetch('/sessions/?before=' + encodeURIComponent(sessionsOlderCursor))
+        .then(function(res) {
+            if (!res.ok) throw new Error('fail');
+            return res.json();
+        })
+        .then(function(page) {
+            sessionsOlderCursor = page.older_cursor;
+            renderSessionList(page.sessions, true);
+        })
+        .catch(function(e) {
+            console.warn('Failed to load older sessions', e);
+        })
+        .finally(function() {
+            loadingOlderSessions = false;
+        });
+}
+
+if (sessionList) {
+    sessionList.addEventListener('scroll', function() {
+        if (sessionList.scrollTop + sessionList.clientHeight >= sessionList.scrollHeight - SCROLL_LOAD_MARGIN) {
+            loadOlderSessions();
+        }
+    });
+}
+
+function renderSessionList(sessions, append) {
     if (!sessionList) return;
-    var items = sessionList.querySelectorAll('.session-item');
-    items.forEach(function(el) { el.remove(); });
+    if (!append) {
+        var items = sessionList.querySelectorAll('.session-item');
+        items.forEach(function(el) { el.remove(); });
 
-    if (!sessions || !sessions.length) {
-        if (sidebarEmpty) sidebarEmpty.style.display = '';
-        return;
+        if (!sessions || !sessions.length) {
+            if (sidebarEmpty) sidebarEmpty.style.display = '';
+            return;
+        }
     }
 
     if (sidebarEmpty) sidebarEmpty.style.display = 'none';
@@ -359,7 +400,11 @@ function renderSessionList(sessions) {
             '</div>' +
             '<div class="session-info">' +
                 '<div class="session-title">' + escapeHtml(s.title) + '</div>' +
-                '<div class="session-time">' + formatTimeAgo(s.updated_at) + '</div>' +
+                (s.last_message_preview ? '<div class="session-preview">' + escapeHtml(s.last_message_preview) + '</div>' : '') +
+                '<div class="session-time">' + formatTimeAgo(s.updated_at) +
+                    (s.message_count ? ' · ' + s.message_count + ' رسالة' : '') +
+                    (s.image_count ? ' · 🖼 ' + s.image_count : '') +
+                '</div>' +
             '</div>' +
             '<button class="session-delete" title="حذف">' +
                 '<svg viewBox="0 0 24 24"><path d="M6 19c0 1.1.9 2 2 2h8c1.1 0 2-.9 2-2V7H6v12zM19 4h-3.5l-1-1h-5l-1 1H5v2h14V4z"/></svg>' +
@@ -390,12 +435,12 @@ function openSession(sessionId) {
         })
         .then(function(data) {
             currentSessionId = sessionId;
+            messagesOlderCursor = data.older_cursor;
             chatHistory = data.messages.map(function(m) { return { role: m.role, text: m.text }; });
 
             clearMessages();
             data.messages.forEach(function(m) {
-                var imgUrls = (m.images || []).map(function(img) { return img.path; });
-                addMessage(m.text, m.role, imgUrls);
+                addMessage(m.text, m.role, m.images || []);
             });
 
             updateSummaryBtn();
@@ -407,6 +452,35 @@ function openSession(sessionId) {
         });
 }
 
+function loadOlderMessages() {
+    if (!currentSessionId || !messagesOlderCursor || loadingOlderMessages) return;
+    var sessionId = currentSessionId;
+    loadingOlderMessages = true;
+    fetch('/sessions/' + sessionId + '/messages?before=' + encodeURIComponent(messagesOlderCursor))
+        .then(function(res) {
+            if (!res.ok) throw new Error('fail');
+            return res.json();
+        })
+        .then(function(page) {
+            if (sessionId !== currentSessionId) return;
+            messagesOlderCursor = page.older_cursor;
+            chatHistory = page.messages.map(function(m) { return { role: m.role, text: m.text }; }).concat(chatHistory);
+            prependMessages(page.messages);
+        })
+        .catch(function() {
+            showToast('فشل تحميل الرسائل الأقدم');
+        })
+        .finally(function() {
+            loadingOlderMessages = false;
+        });
+}
+
+if (messagesContainer) {
+    messagesContainer.addEventListener('scroll', function() {
+        if (messagesContainer.scrollTop <= SCROLL_LOAD_MARGIN) loadOlderMessages();
+    });
+}
+
 function deleteSession(sessionId) {
     fetch('/sessions/' + sessionId, { method: 'DELETE' })
         .then(function() {
@@ -429,6 +503,7 @@ function highlightActiveSession() {
 /* ===== New chat ===== */
 function startNewChat() {
     currentSessionId = null;
+    messagesOlderCursor = null;
     chatHistory = [];
     clearMessages();
     clearImagePreview();
@@ -475,17 +550,21 @@ function formatMarkdown(text) {
 function buildImagesHtml(imageUrls) {
     if (!imageUrls || !imageUrls.length) return '';
     var html = '<div class="msg-images">';
-    imageUrls.forEach(function(src) {
-        html += '<img class="msg-image" src="' + escapeHtml(src) + '" alt="صورة مرفقة" onclick="openLightbox(this.src)">';
+    imageUrls.forEach(function(image) {
+        // Saved images come with derivatives; fall back to the original until they exist.
+        var full = typeof image === 'string' ? image : image.path;
+        var thumb = typeof image === 'string' ? image : (image.thumbnail_path || image.path);
+        var preview = typeof image === 'string' ? image : (image.preview_path || image.path);
+        html += '<img class="msg-image" loading="lazy" src="' + escapeHtml(thumb) + '"' +
+            ' data-preview="' + escapeHtml(preview) + '" data-full="' + escapeHtml(full) + '"' +
+            ' alt="صورة مرفقة" onerror="this.onerror=null;this.src=this.dataset.full"' +
+            ' onclick="openLightbox(this.dataset.preview, this.dataset.full)">';
     });
     html += '</div>';
     return html;
 }
 
-function addMessage(text, role, imageUrls) {
-    if (chatEmpty) chatEmpty.style.display = 'none';
-    if (!messagesContainer) return;
-
+function buildMessage(text, role, imageUrls) {
     var msg = document.createElement('div');
     msg.className = 'msg ' + role;
 
@@ -499,9 +578,59 @@ function addMessage(text, role, imageUrls) {
     msg.innerHTML =
         '<div class="msg-avatar">' + avatarSvg + '</div>' +
         '<div class="msg-bubble">' + imagesHtml + content + '</div>';
+    return msg;
+}
+
+function addMessage(text, role, imageUrls) {
+    if (chatEmpty) chatEmpty.style.display = 'none';
+    if (!messagesContainer) return;
 
+    var msg = buildMessage(text, role, imageUrls);
     messagesContainer.insertBefore(msg, typingIndicator);
     scrollToBottom();
+    return msg;
+}
+
+// Insert older messages above the current ones without moving the view.
+function prependMessages(messages) {
+    if (!messagesContainer || !messages.length) return;
+    var first = messagesContainer.querySelector('.msg') || typingIndicator;
+    var previousHeight = messagesContainer.scrollHeight;
+    messages.forEach(function(m) {
+        messagesContainer.insertBefore(buildMessage(m.text, m.role, m.images || []), first);
+    });
+    messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+}
+
+/* ===== Streaming (Server-Sent Events over fetch) ===== */
+function readEventStream(res, onEvent) {
+    var reader = res.body.getReader();
+    var decoder = new TextDecoder();
+    var buffer = '';
+
+    function pump() {
+        return reader.read().then(function(chunk) {
+            if (chunk.done) return;
+            buffer += decoder.decode(chunk.value, { stream: true });
+
+            var boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                var block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                var event = 'message';
+                var dataLines = [];
+                block.split('\n').forEach(function(line) {
+                    if (line.indexOf('event:') === 0) event = line.slice(6).trim();
+                    else if (line.indexOf('data:') === 0) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+            return pump();
+        });
+    }
+
+    return pump();
 }
 
 function showTyping() {
@@ -564,36 +693,59 @@ if (chatForm) {
 
         clearImagePreview();
 
-        fetch('/gemini/chat', {
+        var botMsg = null;
+        var answer = '';
+        var finished = false;
+
+        fetch('/gemini/chat/stream', {
             method: 'POST',
             body: formData
         })
         .then(function(res) {
-            return res.json().then(function(data) {
-                return { ok: res.ok, data: data };
-            });
-        })
-        .then(function(result) {
-            hideTyping();
-
-            if (!result.ok) {
-                throw new Error(result.data.detail || 'حدث خطأ غير متوقع');
+            if (!res.ok || !res.body) {
+                return res.json().catch(function() { return {}; }).then(function(data) {
+                    throw new Error(data.detail || 'حدث خطأ غير متوقع');
+                });
             }
 
-            addMessage(result.data.response, 'bot');
-            chatHistory.push({ role: 'bot', text: result.data.response });
-
-            if (result.data.session_id) {
-                currentSessionId = result.data.session_id;
-                updateSummaryBtn();
-            }
+            return readEventStream(res, function(event, data) {
+                if (event === 'session') {
+                    if (data.session_id) {
+                        currentSessionId = data.session_id;
+                        updateSummaryBtn();
+                    }
+                } else if (event === 'token') {
+                    if (!botMsg) {
+                        hideTyping();
+                        botMsg = addMessage('', 'bot');
+                    }
+                    answer += data.text;
+                    botMsg.querySelector('.msg-bubble').innerHTML = formatMarkdown(answer);
+                    scrollToBottom();
+                } else if (event === 'done') {
+                    finished = true;
+                    if (!botMsg) {
+                        hideTyping();
+                        botMsg = addMessage('', 'bot');
+                    }
+                    answer = data.response;
+                    botMsg.querySelector('.msg-bubble').innerHTML = formatMarkdown(answer);
+                } else if (event === 'error') {
+                    throw new Error(data.detail || 'حدث خطأ غير متوقع');
+                }
+            });
+        })
+        .then(function() {
+            if (!finished) throw new Error('انقطع الاتصال قبل اكتمال الإجابة');
 
+            chatHistory.push({ role: 'bot', text: answer });
             loadSessions();
             highlightActiveSession();
         })
         .catch(function(err) {
             hideTyping();
             addMessage('خطأ: ' + err.message, 'bot');
+            if (currentSessionId) loadSessions();
         })
         .finally(function() {
             if (sendBtn) sendBtn.disabled = false;
@@ -43,29 +43,6 @@ function hideAll() {
     compareResult.classList.remove('active');
 }
 
-function animateSteps() {
-    const steps = [
-        document.getElementById('step1'),
-        document.getElementById('step2'),
-        document.getElementById('step3')
-    ];
-
-    steps.forEach(s => { s.classList.remove('active', 'done'); });
-    steps[0].classList.add('active');
-
-    setTimeout(() => {
-        steps[0].classList.remove('active');
-        steps[0].classList.add('done');
-        steps[1].classList.add('active');
-    }, 2500);
-
-    setTimeout(() => {
-        steps[1].classList.remove('active');
-        steps[1].classList.add('done');
-        steps[2].classList.add('active');
-    }, 5000);
-}
-
 function decodeUrl(url) {
     try { return decodeURIComponent(url); }
     catch { return url; }
@@ -111,24 +88,98 @@ async function fetchRAG(query, numLinks, website) {
     return data;
 }
 
+async function streamRAG(query, numLinks, website, onEvent) {
+    const settings = getSettings();
+    const body = { query, num_links: numLinks, website };
+    if (settings.apiKey) body.api_key = settings.apiKey;
+    if (settings.model) body.model = settings.model;
+
+    const res = await fetch('/rag/query/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(body)
+    });
+    if (!res.ok || !res.body) {
+        const data = await res.json().catch(() => ({}));
+        throw new Error(data.detail || 'حدث خطأ غير متوقع');
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            const dataLines = [];
+            block.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+            });
+            if (dataLines.length) onEvent(event, JSON.parse(dataLines.join('\n')));
+        }
+    }
+}
+
+function setStep(index) {
+    ['step1', 'step2', 'step3'].forEach((id, i) => {
+        const step = document.getElementById(id);
+        step.classList.toggle('done', i < index);
+        step.classList.toggle('active', i === index);
+    });
+}
+
 async function submitNormal(query, links) {
     const website = document.getElementById('websiteSelect').value;
+    const responseBody = document.getElementById('responseBody');
+    const resultMeta = document.getElementById('resultMeta');
 
     hideAll();
     loadingState.classList.add('active');
-    animateSteps();
+    setStep(0);
 
-    try {
-        const data = await fetchRAG(query, links, website);
+    let answer = '';
+    let finished = false;
 
+    const showResult = () => {
+        if (resultCard.classList.contains('active')) return;
         hideAll();
         resultCard.classList.add('active');
-
-        document.getElementById('resultMeta').textContent =
-            `تم الاسترجاع من ${data.used_links.length} مصدر — ${data.source}`;
-        document.getElementById('responseBody').textContent = data.response;
-        renderSources(document.getElementById('sourcesList'), data.used_links);
+        document.getElementById('sourcesList').innerHTML = '';
         resultCard.scrollIntoView({ behavior: 'smooth', block: 'start' });
+    };
+
+    try {
+        await streamRAG(query, links, website, (event, data) => {
+            if (event === 'links') {
+                setStep(1);
+            } else if (event === 'source') {
+                setStep(2);
+            } else if (event === 'token') {
+                showResult();
+                answer += data.text;
+                resultMeta.textContent = 'جاري توليد الإجابة...';
+                responseBody.textContent = answer;
+            } else if (event === 'done') {
+                finished = true;
+                showResult();
+                resultMeta.textContent =
+                    `تم الاسترجاع من ${data.used_links.length} مصدر — ${data.source}`;
+                responseBody.textContent = data.response;
+                renderSources(document.getElementById('sourcesList'), data.used_links);
+            } else if (event === 'error') {
+                throw new Error(data.detail || 'حدث خطأ غير متوقع');
+            }
+        });
+        if (!finished) throw new Error('انقطع الاتصال قبل اكتمال الإجابة');
 
     } catch (err) {
         hideAll();
@@ -1,17 +1,59 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from app.routers import gemini, rag, settings, chat_sessions
+from app.database import close_redis_client, close_settings_engines
+from app.database.indexes import ensure_indexes
+from app.services.scraper import close_http_client
+from app.services.parse_pool import shutdown_parse_pool
+from app.services.gemini_client import shutdown_gemini_client
+from app.services.summaries import run_summary_precompute
+from app.services.uploads import ImmutableStaticFiles, shutdown_image_pool
+from app.services.settings_cache import load_settings, run_settings_listener
+from app.config import SUMMARY_PRECOMPUTE_ENABLED
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not caught: until the is_deleted backfill has run, legacy sessions are
+    # missing from the session list.
+    await ensure_indexes()
+
+    try:
+        await load_settings()
+    except Exception as e:
+        # Loaded lazily on first use instead.
+        logger.warning("Could not load settings at startup: %s", e)
+
+    background = [asyncio.create_task(run_settings_listener())]
+    if SUMMARY_PRECOMPUTE_ENABLED:
+        background.append(asyncio.create_task(run_summary_precompute()))
+    yield
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await close_http_client()
+    await close_redis_client()
+    await close_settings_engines()
+    shutdown_parse_pool()
+    shutdown_gemini_client()
+    shutdown_image_pool()
 
 
-app = FastAPI(title="Medical RAG & Chat")
+app = FastAPI(title="Medical RAG & Chat", lifespan=lifespan)
 
 app.include_router(gemini.router, prefix="/gemini", tags=["Gemini"])
 app.include_router(rag.router, prefix="/rag", tags=["RAG"])
 app.include_router(settings.router, prefix="/settings", tags=["Settings"])
 app.include_router(chat_sessions.router, prefix="/sessions", tags=["Chat Sessions"])
 
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+app.mount("/uploads", ImmutableStaticFiles(directory="uploads"), name="uploads")
 app.mount("/frontend", StaticFiles(directory="frontend"), name="frontend") #give the frontend files to the client
 
 @app.get("/")
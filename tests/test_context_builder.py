@@ -0,0 +1,35 @@
+from app.services.context_builder import build_context, estimate_tokens
+
+
+def _entries(lengths: list[int]) -> list[dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "model", "text": "كلمة " * n, "seq": i + 1}
+        for i, n in enumerate(lengths)
+    ]
+
+
+def _tokens(history: list[dict]) -> int:
+    return sum(estimate_tokens(turn["parts"][0]) for turn in history)
+
+
+def test_window_starts_on_a_user_turn():
+    history, compact_upto = build_context(_entries([50] * 8), None, budget=300)
+    assert history[0]["role"] == "user"
+    assert _tokens(history) <= 300
+    assert compact_upto == 6
+
+
+def test_oversized_latest_exchange_is_truncated_not_dropped():
+    entries = _entries([50] * 8 + [2000, 2000])
+    history, compact_upto = build_context(entries, None, budget=1000)
+    assert [turn["role"] for turn in history] == ["user", "model"]
+    assert _tokens(history) <= 1000
+    assert compact_upto == 8
+
+
+def test_summary_goes_first_and_covers_compacted_turns():
+    summary = {"text": "ملخص", "upto_seq": 4}
+    history, compact_upto = build_context(_entries([50] * 8), summary)
+    assert history[0]["parts"][0].endswith("ملخص")
+    assert len(history) == 2 + 4
+    assert compact_upto is None
@@ -0,0 +1,18 @@
+import google.generativeai as genai
+
+from app.services import gemini_client
+
+
+def test_models_for_different_keys_use_different_clients(monkeypatch):
+    def configure(*args, **kwargs):
+        raise AssertionError("genai.configure swaps the process-wide key")
+
+    monkeypatch.setattr(genai, "configure", configure)
+
+    first = gemini_client.get_model("key-one", "gemini-test")
+    second = gemini_client.get_model("key-two", "gemini-test")
+
+    assert first._client is not None and second._client is not None
+    assert first._client is not second._client
+    assert first._client is gemini_client._get_client("key-one")
+    assert gemini_client.get_model("key-one", "gemini-test")._client is first._client
@@ -0,0 +1,85 @@
+import re
+
+import pytest
+
+from app.services.scraper import IncrementalMarkdownCleaner, clean_gemini_response
+
+
+def original_clean(text: str) -> str:
+    """clean_gemini_response as it was before streaming; both must match it."""
+    if not text:
+        return "لم يتم توليد رد"
+
+    text = re.sub(r'```[\w]*\n?.*?```', '', text, flags=re.DOTALL)
+    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
+    text = re.sub(r'(?<!\w)\*(?!\*)(.+?)\*(?!\*)', r'\1', text)
+    text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+    text = re.sub(r'^\s*[\*\-]\s+', '• ', text, flags=re.MULTILINE)
+    text = re.sub(r'<[^>]+>', '', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r' +\n', '\n', text)
+    text = re.sub(r' {2,}', ' ', text)
+
+    return text.strip()
+
+
+ANSWER = (
+    "**الأعراض الشائعة**\n"
+    "* الحمى المرتفعة\n"
+    "* السعال الجاف\n"
+    "\n"
+    "**العلاج**\n"
+    "- الراحة وشرب السوائل <br> عند الحاجة\n"
+)
+
+SAMPLES = [
+    "",
+    ANSWER,
+    "مقدمة\n```python\nprint('x')\n```\nبعد الكود",
+    "نص **عريض** ثم *مائل* وكلمة",
+    "سطر أول\n* بند أول\n- بند ثان\n\n## عنوان\nنص",
+    "قبل <b>وسم</b> و <br> بعد\n<p>فقرة</p>\nx < y > z",
+    "# \n\n<b>\n\nنص بعد أسطر فارغة",
+    "- \n\n\n* ``` غير مغلق",
+    "x < 5\nand y > 3",
+    "سطر <span\nclass='a'>\n- بند\n- بند آخر",
+    "x < 5 بدون إغلاق\n* بند",
+]
+
+
+def _stream(text: str, size: int) -> list[str]:
+    cleaner = IncrementalMarkdownCleaner()
+    parts = [cleaner.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    parts.append(cleaner.finish())
+    return parts
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_clean_gemini_response_is_unchanged(text):
+    assert clean_gemini_response(text) == original_clean(text)
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunked_output_matches_full_clean(text, size):
+    assert "".join(_stream(text, size)) == original_clean(text)
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_every_split_point_matches_full_clean(text):
+    for cut in range(len(text) + 1):
+        cleaner = IncrementalMarkdownCleaner()
+        out = cleaner.feed(text[:cut]) + cleaner.feed(text[cut:]) + cleaner.finish()
+        assert out == original_clean(text), cut
+
+
+def test_text_is_emitted_before_finish():
+    parts = _stream(ANSWER, 5)
+    streamed = "".join(parts[:-1])
+    assert "الأعراض الشائعة" in streamed
+    assert "• الحمى المرتفعة" in streamed
+    assert "العلاج" in streamed
+
+
+def test_empty_stream_gets_placeholder():
+    assert IncrementalMarkdownCleaner().finish() == original_clean("")
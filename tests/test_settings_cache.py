@@ -0,0 +1,42 @@
+import asyncio
+
+from app.schemas import SettingsResponse
+from app.services import settings_cache
+
+
+class FakeRedis:
+    def __init__(self):
+        self.version = 0
+        self.published = []
+
+    async def incr(self, key):
+        self.version += 1
+        return self.version
+
+    async def publish(self, channel, message):
+        self.published.append(message)
+
+
+def _settings(model: str) -> SettingsResponse:
+    return SettingsResponse(api_key="", model=model, language="ar", context_messages=4)
+
+
+def test_saving_worker_reloads_the_row_instead_of_trusting_its_copy(monkeypatch):
+    redis = FakeRedis()
+    stored = _settings("model-y")
+
+    async def read_settings():
+        return stored
+
+    monkeypatch.setattr(settings_cache, "get_cache_redis", lambda: redis)
+    monkeypatch.setattr(settings_cache, "_read_settings", read_settings)
+    monkeypatch.setattr(settings_cache, "_load_lock", None)
+    monkeypatch.setattr(settings_cache, "_settings", None)
+    monkeypatch.setattr(settings_cache, "_loaded", False)
+    monkeypatch.setattr(settings_cache, "_version", 0)
+
+    # This worker saved model-x, but another save (model-y) committed since.
+    asyncio.run(settings_cache.settings_changed(_settings("model-x")))
+
+    assert asyncio.run(settings_cache.get_settings()).model == "model-y"
+    assert redis.published == ["1"]